@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 from django_summernote.admin import SummernoteModelAdmin
-from .models import Topic, Question, UserProgress, TopicProgress
+from .models import Topic, Question, TestCase, UserProgress, TopicProgress, ExecutionJob, Submission
+from .regrade import get_setting as regrade_setting, start_regrade
 
 admin.site.site_header = "PyLearn Administration"
 admin.site.site_title = "PyLearn Admin"
@@ -32,6 +33,12 @@ class TopicAdmin(SummernoteModelAdmin):
     questions_count.short_description = 'Questions'
 
 
+class TestCaseInline(admin.TabularInline):
+    model = TestCase
+    extra = 1
+    fields = ('order', 'stdin', 'expected_output', 'hidden')
+
+
 @admin.register(Question)
 class QuestionAdmin(SummernoteModelAdmin):
     summernote_fields = ('description',)
@@ -43,13 +50,27 @@ class QuestionAdmin(SummernoteModelAdmin):
     ordering = ('topic', 'order')
     
     # Using simple fields instead of fieldsets to avoid collapsible section issues
-    fields = ('topic', 'title', 'order', 'description', 'expected_output', 'required_keywords', 'hint')
+    fields = ('topic', 'title', 'order', 'description', 'expected_output', 'required_keywords', 'hint', 'fail_fast')
+    inlines = [TestCaseInline]
     
     def has_keywords(self, obj):
         return bool(obj.required_keywords)
     has_keywords.short_description = 'Has Keywords'
     has_keywords.boolean = True
 
+    actions = ['regrade_submissions']
+    
+    def regrade_submissions(self, request, queryset):
+        questions = list(queryset)
+        pid = start_regrade(questions)
+        log_file = regrade_setting('LOG_FILE')
+        self.message_user(
+            request,
+            f'Regrading submissions for {len(questions)} question(s) in the background (pid {pid})'
+            + (f'; the report is written to {log_file}.' if log_file else '.')
+        )
+    regrade_submissions.short_description = 'Regrade stored submissions'
+
 
 @admin.register(UserProgress)
 class UserProgressAdmin(admin.ModelAdmin):
@@ -74,6 +95,22 @@ class TopicProgressAdmin(admin.ModelAdmin):
     list_filter = ('is_unlocked', 'is_completed', 'user')
 
 
+@admin.register(ExecutionJob)
+class ExecutionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'question', 'status', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('user__username', 'question__title')
+    readonly_fields = ('code', 'result', 'created_at', 'started_at', 'finished_at')
+
+
+@admin.register(Submission)
+class SubmissionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'question', 'verdict', 'runtime', 'output_size', 'created_at')
+    list_filter = ('verdict',)
+    search_fields = ('user__username', 'question__title')
+    readonly_fields = ('user', 'question', 'code', 'verdict', 'runtime', 'output_size', 'created_at')
+
+
 class CustomUserAdmin(UserAdmin):
     search_fields = ('username', 'email')
 
@@ -0,0 +1,173 @@
+"""
+Admission control for the code execution endpoints.
+
+Every run forks an interpreter, so run-code and submit requests are
+admitted before any work is done:
+
+- each user has a token bucket of BURST runs refilled at RATE runs per
+  second, so a client looping on run-code is held to RATE;
+- at most MAX_CONCURRENT executions run at once across all processes.
+  Beyond that, requests are refused immediately instead of queueing
+  behind the worker pools, so admitted runs keep their latency.
+
+A refused request raises DRF's Throttled, which becomes a 429 response
+with a Retry-After header.
+
+The state lives in the shared cache. The bucket is kept as a single
+theoretical arrival time (GCRA), read and advanced under a per-user lock
+so concurrent requests cannot spend the same token. The lock and each
+concurrency slot are keys taken with cache.add and leased for a few
+seconds, so a process that dies holding one cannot leak it. Both need
+cache.add to be atomic (Redis, Memcached, the local-memory and database
+caches). The file cache's add is not, and it has no get_many, so every
+request would cost dozens of file operations and still over-admit:
+admission is off when the default cache is file-based, whatever ENABLED
+says.
+"""
+from contextlib import asynccontextmanager, contextmanager
+import math
+import random
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from rest_framework.exceptions import Throttled
+
+from . import metrics
+
+DEFAULTS = {
+    'ENABLED': True,
+    'RATE': 0.5,
+    'BURST': 10,
+    # None disables the global cap
+    'MAX_CONCURRENT': 32,
+    'SLOT_TIMEOUT': 30,
+    # Retry-After for requests refused because every slot was taken
+    'RETRY_AFTER': 1,
+    # Seconds a request waits for its user's bucket lock before it is refused
+    'LOCK_WAIT': 1.0,
+}
+
+BUCKET_KEY = 'admission:bucket:{}'
+BUCKET_LOCK_KEY = 'admission:bucket-lock:{}'
+SLOT_KEY = 'admission:slot:{}'
+# Lease of a bucket lock; it is held for two cache round trips
+LOCK_TIMEOUT = 5
+LOCK_POLL_INTERVAL = 0.002
+
+
+def get_setting(name):
+    return getattr(settings, 'ADMISSION', {}).get(name, DEFAULTS[name])
+
+
+def is_enabled():
+    return get_setting('ENABLED') and not isinstance(caches['default'], FileBasedCache)
+
+
+@contextmanager
+def bucket_lock(user_id):
+    """Hold the user's bucket lock; yields False when it was not free within LOCK_WAIT."""
+    key = BUCKET_LOCK_KEY.format(user_id)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + get_setting('LOCK_WAIT')
+    while not cache.add(key, token, LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield True
+    finally:
+        release_slot((key, token))
+
+
+def take_token(user_id):
+    """Spend one of the user's runs; returns 0, or the seconds until one is available."""
+    interval = 1 / get_setting('RATE')
+    burst = get_setting('BURST')
+    key = BUCKET_KEY.format(user_id)
+    with bucket_lock(user_id) as locked:
+        if not locked:
+            return get_setting('RETRY_AFTER')
+        now = time.time()
+        arrival = max(cache.get(key, now), now)
+        wait = arrival - now - (burst - 1) * interval
+        if wait > 0:
+            return wait
+        cache.set(key, arrival + interval, math.ceil(burst * interval) + 1)
+        return 0
+
+
+def acquire_slot():
+    """Take a global execution slot; returns (key, token), or None when all are taken."""
+    keys = [SLOT_KEY.format(i) for i in range(get_setting('MAX_CONCURRENT'))]
+    # Start at a random slot so concurrent requests do not all race for the first ones
+    random.shuffle(keys)
+    taken = cache.get_many(keys)
+    token = uuid.uuid4().hex
+    for key in keys:
+        if key not in taken and cache.add(key, token, get_setting('SLOT_TIMEOUT')):
+            return key, token
+    return None
+
+
+def release_slot(slot):
+    """Free a slot, or a bucket lock, unless its lease has already passed to someone else."""
+    key, token = slot
+    # The lease may have expired and been taken by another run
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def enter(user, concurrency=True):
+    """
+    Admit an execution for `user` or raise Throttled. `concurrency` is
+    False for requests that only enqueue a job. Returns the slot to pass
+    to leave().
+    """
+    if not is_enabled():
+        return None
+    slot = None
+    if concurrency and get_setting('MAX_CONCURRENT') is not None:
+        slot = acquire_slot()
+        if slot is None:
+            metrics.ADMISSION_REJECTED.inc(reason='capacity')
+            raise Throttled(
+                wait=get_setting('RETRY_AFTER'),
+                detail='Code execution is at capacity, please try again shortly.'
+            )
+    wait = take_token(user.id)
+    if wait:
+        if slot is not None:
+            release_slot(slot)
+        metrics.ADMISSION_REJECTED.inc(reason='rate')
+        raise Throttled(wait=math.ceil(wait))
+    return slot
+
+
+def leave(slot):
+    if slot is not None:
+        release_slot(slot)
+
+
+@contextmanager
+def admit(user, concurrency=True):
+    """Run the block as an admitted execution; see enter()."""
+    slot = enter(user, concurrency)
+    try:
+        yield
+    finally:
+        leave(slot)
+
+
+@asynccontextmanager
+async def aadmit(user, concurrency=True):
+    """admit() for async views."""
+    slot = await sync_to_async(enter, thread_sensitive=False)(user, concurrency)
+    try:
+        yield
+    finally:
+        await sync_to_async(leave, thread_sensitive=False)(slot)
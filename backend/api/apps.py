@@ -3,4 +3,13 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'api'
\ No newline at end of file
+    name = 'api'
+
+    def ready(self):
+        from django.core.signals import request_started
+
+        from . import signals  # noqa: F401
+        from .runner import warm_pool
+
+        # Only processes that serve requests start workers, not management commands
+        request_started.connect(warm_pool, dispatch_uid='runner_warm_pool')
@@ -0,0 +1,284 @@
+"""
+Asyncio counterpart of api.runner for the async execution views.
+
+Workers speak the same runner_worker protocol but are started with
+asyncio.create_subprocess_exec and talked to through the event loop, so
+a run waiting for a free worker or for its result holds no thread. Under
+an ASGI server one process can keep as many executions in flight as it
+has requests; POOL_SIZE still bounds how many run at once.
+
+Subprocess transports belong to the loop that created them, so every
+event loop gets its own pool. That suits ASGI servers, which run one
+loop per process. Under WSGI each async request runs in a loop of its
+own and would start its workers cold; use the sync views there.
+
+Only the transport lives here: requests, validation and result shaping
+are shared with api.runner, and platforms without os.fork run the sync
+subprocess fallback in a thread.
+"""
+import asyncio
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+
+from . import metrics
+from .profiling import timed
+from . import runner
+from .runner import (
+    HEADER,
+    WORKER_SCRIPT,
+    WORKER_START_TIMEOUT,
+    WorkerError,
+    WorkerTimeout,
+    get_setting,
+    make_request,
+    pool_case_results,
+    pool_result,
+    prepare,
+    record_metrics,
+)
+
+
+class AsyncWorker:
+    """A warm interpreter process driven from the event loop."""
+
+    def __init__(self, proc, started):
+        self.proc = proc
+        self.started = started
+        self.runs = 0
+
+    @classmethod
+    async def start(cls):
+        started = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, '-u', WORKER_SCRIPT,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        return cls(proc, started)
+
+    async def _read_message(self):
+        try:
+            size = HEADER.unpack(await self.proc.stdout.readexactly(HEADER.size))[0]
+            return json.loads((await self.proc.stdout.readexactly(size)).decode('utf-8'))
+        except asyncio.IncompleteReadError:
+            raise WorkerError('Worker exited unexpectedly')
+
+    async def _recv(self, timeout):
+        try:
+            return await asyncio.wait_for(self._read_message(), timeout)
+        except asyncio.TimeoutError:
+            raise WorkerTimeout('Worker did not respond in time')
+
+    async def wait_ready(self, timeout):
+        """Wait for the interpreter to start; returns the start-up time."""
+        await self._recv(timeout)
+        return time.monotonic() - self.started
+
+    async def run(self, request):
+        self.runs += 1
+        body = json.dumps(request).encode('utf-8')
+        try:
+            self.proc.stdin.write(HEADER.pack(len(body)) + body)
+            await self.proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise WorkerError(str(e))
+        # The worker enforces the timeout itself; allow some slack for the reply
+        return await self._recv(request['timeout'] + 2)
+
+    def is_alive(self):
+        return self.proc.returncode is None
+
+    def kill(self):
+        if self.is_alive():
+            try:
+                self.proc.kill()
+            except ProcessLookupError:
+                pass
+
+    async def stop(self):
+        self.kill()
+        await self.proc.wait()
+
+
+class AsyncWorkerPool:
+    """
+    Fixed-size pool of warm workers for one event loop.
+
+    At most `size` runs execute at once; further callers wait on the
+    loop for a free worker. Workers are replaced after `max_runs` runs or
+    on any failure. With `prestart`, as in api.runner.WorkerPool, the
+    workers and retired workers' replacements are started in background
+    tasks. The pool must then be created inside the running loop.
+    """
+
+    def __init__(self, size, max_runs, prestart=False):
+        self.size = size
+        self.max_runs = max_runs
+        self.prestart = prestart
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+        self._closed = False
+        # Strong references, so running start-up tasks are not collected
+        self._tasks = set()
+        metrics.POOL_SIZE.inc(size)
+        if prestart:
+            self._start_in_background(size)
+
+    async def _start_worker(self):
+        worker = await AsyncWorker.start()
+        try:
+            metrics.SPAWN_SECONDS.observe(await worker.wait_ready(WORKER_START_TIMEOUT), kind='cold')
+        except BaseException:
+            worker.kill()
+            raise
+        return worker
+
+    def _start_in_background(self, count):
+        async def start():
+            for _ in range(count):
+                if self._closed:
+                    return
+                try:
+                    worker = await self._start_worker()
+                except WorkerError:
+                    return
+                await self._put_idle(worker)
+        task = asyncio.get_running_loop().create_task(start())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _put_idle(self, worker):
+        # Workers started on demand while the background ones were starting can overshoot the size
+        if self._closed or len(self._idle) >= self.size:
+            await worker.stop()
+        else:
+            self._idle.append(worker)
+
+    async def _acquire_worker(self):
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.is_alive():
+                return worker
+            await worker.stop()
+        return await self._start_worker()
+
+    async def _release_worker(self, worker):
+        if self._closed or worker.runs >= self.max_runs or not worker.is_alive():
+            await worker.stop()
+            if self.prestart and not self._closed:
+                self._start_in_background(1)
+        else:
+            await self._put_idle(worker)
+
+    async def _round_trip(self, request):
+        """The worker's reply, or None when it did not answer in time."""
+        started = time.monotonic()
+        async with self._slots:
+            with metrics.POOL_BUSY.track():
+                metrics.QUEUE_WAIT_SECONDS.observe(time.monotonic() - started)
+                worker = await self._acquire_worker()
+                run_started = time.monotonic()
+                try:
+                    data = await worker.run(request)
+                except WorkerTimeout:
+                    await worker.stop()
+                    return None
+                except BaseException:
+                    # Also on cancellation: the worker may be mid-run
+                    worker.kill()
+                    raise
+                metrics.SPAWN_SECONDS.observe(max(time.monotonic() - run_started - data['duration'], 0), kind='fork')
+                await self._release_worker(worker)
+        return data
+
+    async def run(self, code, timeout, expected_output=None):
+        started = time.monotonic()
+        return pool_result(await self._round_trip(make_request(code, timeout, expected_output=expected_output)), started)
+
+    async def run_cases(self, code, cases, fail_fast, timeout):
+        started = time.monotonic()
+        return pool_case_results(await self._round_trip(make_request(code, timeout, cases, fail_fast)), started)
+
+    def close(self):
+        """Kill the idle workers. Safe to call without a running loop."""
+        if not self._closed:
+            metrics.POOL_SIZE.dec(self.size)
+        self._closed = True
+        while self._idle:
+            self._idle.pop().kill()
+
+    async def aclose(self):
+        """close() from inside the loop, waiting for the workers to exit."""
+        idle = list(self._idle)
+        self.close()
+        for worker in idle:
+            await worker.proc.wait()
+
+
+_pools = weakref.WeakKeyDictionary()
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_async_pool():
+    """Return the worker pool of the running event loop."""
+    global _pools, _pools_pid
+    loop = asyncio.get_running_loop()
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools = weakref.WeakKeyDictionary()
+            _pools_pid = os.getpid()
+        pool = _pools.get(loop)
+        if pool is None:
+            pool = _pools[loop] = AsyncWorkerPool(
+                get_setting('POOL_SIZE'), get_setting('MAX_RUNS_PER_WORKER'), prestart=get_setting('PRESTART')
+            )
+            weakref.finalize(loop, pool.close)
+        return pool
+
+
+@atexit.register
+def _close_pools():
+    if _pools_pid == os.getpid():
+        for pool in list(_pools.values()):
+            pool.close()
+
+
+async def execute(code, timeout=None, expected_output=None, checked=False):
+    """Async api.runner.execute: run a submission and return an ExecutionResult."""
+    rejected, timeout = prepare(code, timeout, checked=checked)
+    if rejected is not None:
+        return rejected
+    with timed('executor'), metrics.EXECUTIONS_IN_FLIGHT.track():
+        if hasattr(os, 'fork'):
+            result, backend = await get_async_pool().run(code, timeout, expected_output), 'pool'
+        else:
+            result = await sync_to_async(runner.run_in_subprocess, thread_sensitive=False)(code, timeout)
+            backend = 'subprocess'
+    record_metrics([result], backend)
+    return result
+
+
+async def execute_cases(code, cases, fail_fast=True, timeout=None, checked=False):
+    """Async api.runner.execute_cases."""
+    rejected, timeout = prepare(code, timeout, cases=True, checked=checked)
+    if rejected is not None:
+        return rejected
+    with timed('executor'), metrics.EXECUTIONS_IN_FLIGHT.track():
+        if hasattr(os, 'fork'):
+            results, backend = await get_async_pool().run_cases(code, cases, fail_fast, timeout), 'pool'
+        else:
+            results = await sync_to_async(runner.run_cases_in_subprocess, thread_sensitive=False)(
+                code, cases, fail_fast, timeout
+            )
+            backend = 'subprocess'
+    record_metrics(results, backend)
+    return results
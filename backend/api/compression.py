@@ -0,0 +1,127 @@
+"""
+Response compression.
+
+CompressionMiddleware compresses response bodies of at least MIN_SIZE
+bytes with the best encoding the client accepts: brotli when the brotli
+package is installed, gzip otherwise. Smaller bodies, streaming
+responses and content types outside CONTENT_TYPES go out unchanged; for
+those the encoding costs more CPU than the bytes it saves.
+
+The middleware removes itself unless COMPRESSION['ENABLED'] is set.
+"""
+import gzip
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI': True,
+    'BROTLI_QUALITY': 4,
+    'CONTENT_TYPES': ('application/json', 'text/', 'application/javascript', 'image/svg+xml'),
+}
+
+_QVALUE = re.compile(r';\s*q\s*=\s*([0-9.]+)')
+
+
+def get_setting(name):
+    return getattr(settings, 'COMPRESSION', {}).get(name, DEFAULTS[name])
+
+
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into {coding: qvalue}."""
+    accepted = {}
+    for item in header.split(','):
+        coding = item.split(';', 1)[0].strip().lower()
+        if not coding:
+            continue
+        match = _QVALUE.search(item)
+        try:
+            accepted[coding] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            accepted[coding] = 0.0
+    return accepted
+
+
+def choose_encoding(header, available):
+    """
+    Return the coding in `available` the client prefers, or None. Ties go to
+    the earlier entry of `available`.
+    """
+    accepted = accepted_encodings(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def get_encoders():
+    """{coding: compress(bytes) -> bytes} in order of preference."""
+    encoders = {}
+    if brotli is not None and get_setting('BROTLI'):
+        quality = get_setting('BROTLI_QUALITY')
+        encoders['br'] = lambda content: brotli.compress(content, quality=quality)
+    level = get_setting('GZIP_LEVEL')
+    # A fixed mtime gives identical bodies identical compressed bytes
+    encoders['gzip'] = lambda content: gzip.compress(content, compresslevel=level, mtime=0)
+    return encoders
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.min_size = get_setting('MIN_SIZE')
+        self.content_types = tuple(get_setting('CONTENT_TYPES'))
+        self.encoders = get_encoders()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        if not content_type.startswith(self.content_types):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_size:
+            return response
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encoders)
+        if encoding is None:
+            return response
+
+        compressed = self.encoders[encoding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed body is not byte-identical to the original one
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,121 @@
+"""
+Cached snapshot of the course structure.
+
+Topics and questions only change through the admin, so the ordered topic
+list, first/next topic, question counts and topic content are built once
+and shared through the cache. Every save or delete of a Topic or Question
+bumps the version (see signals.py) and the next read rebuilds the
+snapshot. Each process also keeps the current snapshot in memory and only
+reads the version key from the shared cache.
+"""
+import threading
+import time
+
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Topic, Question
+
+VERSION_KEY = 'curriculum:version'
+SNAPSHOT_KEY = 'curriculum:snapshot:{}'
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+
+class CurriculumSnapshot:
+    def __init__(self, version, topics, questions_count):
+        self.version = version
+        # Topic field values keyed by id, including theory
+        self.topics = {topic['id']: topic for topic in topics}
+        self.topic_ids = [topic['id'] for topic in topics]
+        self.questions_count = {topic_id: questions_count.get(topic_id, 0) for topic_id in self.topic_ids}
+        self.total_questions = sum(self.questions_count.values())
+        self.first_topic_id = self.topic_ids[0] if self.topic_ids else None
+        self.next_topic_ids = {}
+        for index, topic in enumerate(topics):
+            # Same rule as filter(order__gt=...).first(): skip topics sharing an order
+            self.next_topic_ids[topic['id']] = next(
+                (later['id'] for later in topics[index + 1:] if later['order'] > topic['order']),
+                None
+            )
+
+    def has_topic(self, topic_id):
+        return topic_id in self.topics
+
+    def is_first_topic(self, topic_id):
+        return topic_id == self.first_topic_id
+
+    def next_topic(self, topic_id):
+        """Return the field values of the topic after topic_id, or None."""
+        next_id = self.next_topic_ids.get(topic_id)
+        return self.topics[next_id] if next_id is not None else None
+
+    def topic_instance(self, topic_id):
+        """Build a Topic from the snapshot without a query."""
+        row = self.topics[topic_id]
+        return Topic.from_db(None, list(row), list(row.values()))
+
+    def topic_instances(self):
+        return [self.topic_instance(topic_id) for topic_id in self.topic_ids]
+
+    def theory_signature(self, topic_id, version=None):
+        """
+        Signature that lets the public theory endpoint serve this topic's
+        theory at this version. Only handed out by get_topic, which checks
+        the lock, and the same for every user so shared caches can reuse it.
+        """
+        version = self.version if version is None else version
+        return signing.Signer(salt='curriculum.theory').signature(f'{topic_id}:{version}')
+
+
+def build_snapshot(version):
+    topics = list(Topic.objects.order_by('order').values())
+    questions_count = dict(
+        Question.objects.values('topic_id')
+        .annotate(total=Count('id'))
+        .values_list('topic_id', 'total')
+    )
+    return CurriculumSnapshot(version, topics, questions_count)
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def get_curriculum():
+    """Return the current CurriculumSnapshot, rebuilding it if it changed."""
+    global _current
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+
+    snapshot = _current
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _lock:
+        if _current is not None and _current.version == version:
+            return _current
+        key = SNAPSHOT_KEY.format(version)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            snapshot = build_snapshot(version)
+            cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+        _current = snapshot
+    return snapshot
+
+
+def _publish_new_version():
+    global _current
+    cache.set(VERSION_KEY, time.time_ns(), None)
+    _current = None
+
+
+def invalidate_curriculum(**kwargs):
+    """
+    Signal receiver: publish a new version so every process rebuilds.
+    Deferred until commit so no process rebuilds from uncommitted rows.
+    """
+    transaction.on_commit(_publish_new_version)
@@ -0,0 +1,418 @@
+"""
+Grading of code submissions.
+
+Shared by the submit_code views and the execution job worker so that all
+paths record attempts and unlock topics the same way.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .curriculum import get_curriculum
+from .keyword_rules import missing_keywords
+from .models import UserProgress, TopicProgress, Submission
+from .progress import bump_progress_version
+from .result_cache import aexecute_cached, aexecute_cases_cached, execute_cached, execute_cases_cached
+from .runner import normalize_output, rejection
+
+
+def check_required_keywords(code, required_keywords):
+    """
+    Check if code uses the required keywords (see api.keyword_rules).
+    Returns (is_valid, missing_keywords)
+    """
+    missing = missing_keywords(code, required_keywords)
+    return len(missing) == 0, missing
+
+
+def is_correct(result, expected_output):
+    """Verdict for an execution result"""
+    if result.passed is not None:
+        # The worker compared the output while the code ran
+        return result.passed
+    return (
+        not result.timed_out
+        and result.returncode == 0
+        and normalize_output(result.stdout) == normalize_output(expected_output)
+    )
+
+
+def case_inputs(test_cases):
+    """What the runner needs of each TestCase."""
+    return [{'stdin': case.stdin, 'expected_output': case.expected_output} for case in test_cases]
+
+
+def all_passed(results, test_cases):
+    # Fail-fast stops early, so a short result list is a failure too
+    return len(results) == len(test_cases) and all(result.passed for result in results)
+
+
+def record_submission(user, question, code, verdict, result=None):
+    """Append a row to the submission history. `result` is a list for test case runs."""
+    results = [] if result is None else result if isinstance(result, list) else [result]
+    return Submission.objects.create(
+        user=user,
+        question=question,
+        code=code,
+        verdict=verdict,
+        runtime=sum(r.duration for r in results) if results else None,
+        output_size=sum(len(r.stdout) + len(r.stderr) for r in results)
+    )
+
+
+def record_attempt(user, question, code):
+    """
+    Count an attempt and save the submitted code. The progress row is
+    locked while it is read and incremented, so concurrent submissions
+    from the same user never lose an increment. Returns the new count.
+    """
+    with transaction.atomic():
+        user_progress, created = (
+            UserProgress.objects.select_for_update()
+            .only('id', 'attempts')
+            .get_or_create(
+                user=user,
+                question=question,
+                defaults={'attempts': 1, 'submitted_code': code}
+            )
+        )
+        if created:
+            return 1
+        UserProgress.objects.filter(pk=user_progress.pk).update(
+            attempts=F('attempts') + 1,
+            submitted_code=code  # Save code regardless of result
+        )
+        return user_progress.attempts + 1
+
+
+def record_pass(user, question):
+    """
+    Mark the question completed, keep the topic's completed_count in step
+    and, once every question of the topic is completed, complete the
+    topic and unlock the next one. Runs in one transaction with at most
+    two TopicProgress statements. Returns (topic_completed, field values
+    of the unlocked next topic or None).
+    """
+    curriculum = get_curriculum()
+    with transaction.atomic():
+        # Lock the user's rows in the topic so two passes on different
+        # questions cannot both miss the other's completion. Only the
+        # progress rows: the join would otherwise lock the questions too.
+        completed = dict(
+            UserProgress.objects.select_for_update(of=('self',))
+            .filter(user=user, question__topic_id=question.topic_id)
+            .order_by('id')
+            .values_list('question_id', 'completed')
+        )
+        newly_completed = not completed.get(question.id)
+        if newly_completed:
+            UserProgress.objects.filter(user=user, question=question, completed=False).update(
+                completed=True,
+                completed_at=timezone.now()
+            )
+            completed[question.id] = True
+        
+        completed_count = sum(completed.values())
+        topic_completed = completed_count >= curriculum.questions_count.get(question.topic_id, 0)
+        if topic_completed:
+            TopicProgress.objects.bulk_create(
+                [TopicProgress(
+                    user=user,
+                    topic_id=question.topic_id,
+                    is_unlocked=True,
+                    is_completed=True,
+                    completed_count=completed_count
+                )],
+                update_conflicts=True,
+                unique_fields=['user', 'topic'],
+                update_fields=['is_unlocked', 'is_completed', 'completed_count']
+            )
+        elif newly_completed:
+            TopicProgress.objects.bulk_create(
+                [TopicProgress(
+                    user=user,
+                    topic_id=question.topic_id,
+                    is_unlocked=curriculum.is_first_topic(question.topic_id),
+                    completed_count=completed_count
+                )],
+                update_conflicts=True,
+                unique_fields=['user', 'topic'],
+                update_fields=['completed_count']
+            )
+        if not topic_completed:
+            return False, None
+        
+        next_topic = curriculum.next_topic(question.topic_id)
+        if next_topic is None:
+            return True, None
+        TopicProgress.objects.bulk_create(
+            [TopicProgress(user=user, topic_id=next_topic['id'], is_unlocked=True)],
+            update_conflicts=True,
+            unique_fields=['user', 'topic'],
+            update_fields=['is_unlocked']
+        )
+        return True, next_topic
+
+
+def grade_submission(user, question, code):
+    """
+    Run a submission against a question and record the user's progress.
+    Returns the response payload for submit_code.
+    """
+    attempts = record_attempt(user, question, code)
+    payload, verdict, result = check_submission(user, question, code)
+    return finish_submission(user, question, code, attempts, payload, verdict, result)
+
+
+async def agrade_submission(user, question, code):
+    """grade_submission for async views; the DB work runs in a worker thread."""
+    attempts = await sync_to_async(record_attempt)(user, question, code)
+    payload, verdict, result = await acheck_submission(user, question, code)
+    return await sync_to_async(finish_submission)(user, question, code, attempts, payload, verdict, result)
+
+
+def finish_submission(user, question, code, attempts, payload, verdict, result):
+    payload['attempts'] = attempts
+    record_submission(user, question, code, verdict, result)
+    bump_progress_version(user.id)
+    return payload
+
+
+def check_submission(user, question, code):
+    """
+    Grade the code and apply progress changes for a passing submission.
+    Returns (payload, verdict, execution result or None). Code failing
+    api.validation is judged like a failed run before anything else
+    parses it.
+    """
+    test_cases = list(question.test_cases.all())
+    rejected = rejected_outcome(code, test_cases)
+    if rejected is not None:
+        return judge_submission(user, question, test_cases, rejected)
+    rejected = check_keywords(question, code)
+    if rejected is not None:
+        return rejected
+    try:
+        outcome = run_submission(code, question, test_cases, checked=True)
+    except Exception as e:
+        return execution_failed(question, e)
+    return judge_submission(user, question, test_cases, outcome)
+
+
+async def acheck_submission(user, question, code):
+    """check_submission with the run awaited on the event loop."""
+    test_cases = [case async for case in question.test_cases.all()]
+    rejected = rejected_outcome(code, test_cases)
+    if rejected is not None:
+        return await sync_to_async(judge_submission)(user, question, test_cases, rejected)
+    rejected = check_keywords(question, code)
+    if rejected is not None:
+        return rejected
+    try:
+        outcome = await arun_submission(code, question, test_cases, checked=True)
+    except Exception as e:
+        return execution_failed(question, e)
+    return await sync_to_async(judge_submission)(user, question, test_cases, outcome)
+
+
+def rejected_outcome(code, test_cases):
+    """The run_submission outcome for code failing api.validation, or None."""
+    rejected = rejection(code, cases=bool(test_cases))
+    if rejected is None or test_cases:
+        return rejected
+    return rejected, False
+
+
+def run_submission(code, question, test_cases, pool=None, checked=False):
+    """
+    Run code for grading, through the result cache: a result per case
+    run when the question has test cases, (result, passed) otherwise.
+    """
+    if test_cases:
+        return execute_cases_cached(code, question, case_inputs(test_cases), pool=pool, checked=checked)
+    return execute_cached(
+        code, question, grade=lambda result: is_correct(result, question.expected_output), pool=pool, checked=checked
+    )
+
+
+async def arun_submission(code, question, test_cases, checked=False):
+    """run_submission for async views."""
+    if test_cases:
+        return await aexecute_cases_cached(code, question, case_inputs(test_cases), checked=checked)
+    return await aexecute_cached(
+        code, question, grade=lambda result: is_correct(result, question.expected_output), checked=checked
+    )
+
+
+def submission_passed(test_cases, outcome):
+    """The verdict of a run_submission outcome."""
+    if test_cases:
+        return all_passed(outcome, test_cases)
+    return outcome[1]
+
+
+def judge_submission(user, question, test_cases, outcome):
+    """judge or judge_cases, whichever fits the run_submission outcome."""
+    if test_cases:
+        return judge_cases(user, question, test_cases, outcome)
+    result, passed = outcome
+    return judge(user, question, result, passed)
+
+
+def check_keywords(question, code):
+    """The rejection for code missing a required keyword, or None."""
+    # Check required keywords (anti-cheating)
+    is_valid, missing_keywords = check_required_keywords(code, question.required_keywords)
+    
+    if is_valid:
+        return None
+    return {
+        'passed': False,
+        'output': None,
+        'expected': question.expected_output,
+        'message': f'Your code must use: {", ".join(missing_keywords)}',
+        'missing_keywords': missing_keywords,
+    }, Submission.VERDICT_MISSING_KEYWORDS, None
+
+
+def execution_failed(question, error, result=None):
+    return {
+        'passed': False,
+        'output': None,
+        'expected': question.expected_output,
+        'message': str(error),
+    }, Submission.VERDICT_ERROR, result
+
+
+def judge(user, question, result, passed):
+    """Turn an execution result into (payload, verdict, result), recording a pass."""
+    try:
+        if result.timed_out:
+            return {
+                'passed': False,
+                'output': None,
+                'expected': question.expected_output,
+                'message': 'Code execution timed out',
+            }, Submission.VERDICT_TIMEOUT, result
+        
+        if result.limit:
+            return {
+                'passed': False,
+                'output': result.stdout or None,
+                'expected': question.expected_output,
+                'message': result.limit_message,
+                'limit': result.limit,
+            }, Submission.VERDICT_LIMIT, result
+        
+        if result.returncode != 0 and not result.diverged:
+            return {
+                'passed': False,
+                'output': result.stderr,
+                'expected': question.expected_output,
+                'message': 'Code has errors',
+            }, Submission.VERDICT_ERROR, result
+        
+        actual_output = normalize_output(result.stdout)
+        expected_output = normalize_output(question.expected_output)
+        
+        return {
+            'passed': passed,
+            'output': actual_output,
+            'expected': expected_output,
+            'message': 'Correct! Well done!' if passed else 'Output does not match expected result',
+            **progress_fields(user, question, passed),
+        }, Submission.VERDICT_PASSED if passed else Submission.VERDICT_FAILED, result
+        
+    except Exception as e:
+        return execution_failed(question, e, result)
+
+
+def progress_fields(user, question, passed):
+    """Record a pass and return the topic fields of the submit_code payload."""
+    topic_completed = False
+    next_topic_unlocked = False
+    next_topic_name = None
+    
+    if passed:
+        topic_completed, next_topic = record_pass(user, question)
+        if next_topic is not None:
+            next_topic_unlocked = True
+            next_topic_name = next_topic['title']
+    
+    return {
+        'topic_completed': topic_completed,
+        'next_topic_unlocked': next_topic_unlocked,
+        'next_topic_name': next_topic_name,
+    }
+
+
+CASE_VERDICTS = {
+    'failed': (Submission.VERDICT_FAILED, 'Output does not match expected result'),
+    'error': (Submission.VERDICT_ERROR, 'Code has errors'),
+    'timeout': (Submission.VERDICT_TIMEOUT, 'Code execution timed out'),
+    'limit': (Submission.VERDICT_LIMIT, None),
+}
+
+
+def case_status(result):
+    if result.timed_out:
+        return 'timeout'
+    if result.limit:
+        return 'limit'
+    if result.returncode != 0 and not result.diverged:
+        return 'error'
+    return 'passed' if result.passed else 'failed'
+
+
+def judge_cases(user, question, test_cases, results):
+    """
+    judge for a question with test cases. The payload lists every case
+    with its status and timing; cases fail-fast did not run are 'skipped'.
+    Hidden cases show no input or output.
+    """
+    try:
+        cases = []
+        failure = None
+        for index, test_case in enumerate(test_cases):
+            result = results[index] if index < len(results) else None
+            status = case_status(result) if result is not None else 'skipped'
+            case = {
+                'case': index + 1,
+                'status': status,
+                'duration_ms': round(result.duration * 1000, 1) if result is not None else None,
+            }
+            if not test_case.hidden:
+                case['stdin'] = test_case.stdin
+                case['expected'] = normalize_output(test_case.expected_output)
+                if result is not None:
+                    case['output'] = result.stderr if status == 'error' else normalize_output(result.stdout)
+            cases.append(case)
+            if failure is None and status not in ('passed', 'skipped'):
+                failure = (case, result)
+        
+        passed = failure is None and all_passed(results, test_cases)
+        if passed:
+            return {
+                'passed': True,
+                'output': None,
+                'expected': None,
+                'message': 'Correct! Well done!',
+                'cases': cases,
+                **progress_fields(user, question, True),
+            }, Submission.VERDICT_PASSED, results
+        
+        case, result = failure
+        verdict, message = CASE_VERDICTS[case['status']]
+        return {
+            'passed': False,
+            'output': case.get('output'),
+            'expected': case.get('expected'),
+            'message': f"Test case {case['case']} of {len(test_cases)}: {message or result.limit_message}",
+            'limit': result.limit,
+            'cases': cases,
+            **progress_fields(user, question, False),
+        }, verdict, results
+        
+    except Exception as e:
+        return execution_failed(question, e, results)
@@ -0,0 +1,55 @@
+"""
+HTTP validators for conditional GETs.
+
+Views build a weak ETag and a Last-Modified time from the curriculum
+version and the user's progress version, and answer a matching
+If-None-Match / If-Modified-Since with a 304 before loading or
+serializing anything.
+"""
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    # Weak, since compression or renderers may change the bytes
+    return 'W/"{}"'.format('-'.join(str(part) for part in parts))
+
+
+def representation_key(request):
+    """Distinguishes responses for different ?fields= selections in an ETag."""
+    fields = request.GET.get('fields', '')
+    return hashlib.sha1(fields.encode('utf-8')).hexdigest()[:12] if fields else 'default'
+
+
+def version_time(*versions):
+    """Last-Modified timestamp (seconds) for time_ns based versions."""
+    return max(versions) // 1_000_000_000
+
+
+def not_modified(request, etag, last_modified):
+    """
+    Return the response for a request whose validators already decide it
+    (304, or 412 for a failed If-Match), else None.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if isinstance(response, HttpResponseNotModified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified, private=True, max_age=0, immutable=False):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if private:
+        # Per-user content: browsers may keep it but must revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+    elif immutable:
+        patch_cache_control(response, public=True, max_age=max_age, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
+    return response
@@ -0,0 +1,104 @@
+"""
+Database-backed execution job queue.
+
+submit_code enqueues an ExecutionJob when queue mode is enabled and the
+run_execution_worker management command drains the queue. Jobs are
+claimed with a conditional UPDATE so any number of workers can share the
+same table, including on SQLite.
+
+The attempt is counted when the job is queued. A job left running by a
+dead worker is requeued and graded again, so its result and submission
+history row are only saved by the worker that still holds the claim.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .grading import check_submission, finish_submission, record_attempt
+from .models import ExecutionJob
+
+DEFAULTS = {
+    'ENABLED': False,
+    'CONCURRENCY': 4,
+    'POLL_INTERVAL': 0.5,
+    'STALE_AFTER': 60,
+    'STREAM_TIMEOUT': 60,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'EXECUTION_QUEUE', {}).get(name, DEFAULTS[name])
+
+
+def enqueue(user, question, code):
+    with transaction.atomic():
+        attempts = record_attempt(user, question, code)
+        return ExecutionJob.objects.create(user=user, question=question, code=code, attempts=attempts)
+
+
+def serialize_job(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'result': job.result,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+def claim_jobs(limit):
+    """Mark up to `limit` queued jobs as running and return them."""
+    claimed = []
+    candidates = ExecutionJob.objects.filter(
+        status=ExecutionJob.STATUS_QUEUED
+    ).order_by('created_at').values_list('id', flat=True)[:limit]
+    for job_id in candidates:
+        updated = ExecutionJob.objects.filter(
+            id=job_id,
+            status=ExecutionJob.STATUS_QUEUED
+        ).update(status=ExecutionJob.STATUS_RUNNING, started_at=timezone.now())
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_jobs():
+    """Put back jobs left running by a worker that died."""
+    cutoff = timezone.now() - timedelta(seconds=get_setting('STALE_AFTER'))
+    return ExecutionJob.objects.filter(
+        status=ExecutionJob.STATUS_RUNNING,
+        started_at__lt=cutoff
+    ).update(status=ExecutionJob.STATUS_QUEUED, started_at=None)
+
+
+def run_job(job_id):
+    """Grade a claimed job and store its result. Runs on a worker thread."""
+    try:
+        job = ExecutionJob.objects.select_related('user', 'question').get(id=job_id)
+        try:
+            payload, verdict, result = check_submission(job.user, job.question, job.code)
+            finish_job(job, ExecutionJob.STATUS_DONE, payload, verdict, result)
+        except Exception as e:
+            finish_job(job, ExecutionJob.STATUS_FAILED, {'passed': False, 'output': None, 'message': str(e)})
+    finally:
+        close_old_connections()
+
+
+def finish_job(job, status, payload, verdict=None, result=None):
+    """
+    Save the job's result, and for a graded job its submission history
+    row, unless the job was requeued and claimed again meanwhile.
+    """
+    with transaction.atomic():
+        if status == ExecutionJob.STATUS_DONE:
+            payload = finish_submission(job.user, job.question, job.code, job.attempts, payload, verdict, result)
+        finished = ExecutionJob.objects.filter(
+            id=job.id,
+            status=ExecutionJob.STATUS_RUNNING,
+            started_at=job.started_at
+        ).update(result=payload, status=status, finished_at=timezone.now())
+        if not finished:
+            transaction.set_rollback(True)
@@ -0,0 +1,182 @@
+"""
+Required-keyword rules, checked against the submission's syntax tree.
+
+Each comma-separated entry of Question.required_keywords compiles to one
+rule:
+
+- a Python keyword (`for`, `while`, `def`, `else`, `not`, `True`, ...)
+  requires the construct it introduces;
+- `name()` requires a call of a function or method called `name`;
+- any other identifier (`range`, `len`, `kwlist`, a variable name)
+  requires that name to be used, defined, imported or passed as an
+  argument name;
+- anything else (operators, dotted paths) is matched as text in the
+  source, as before.
+
+Keywords in comments and strings no longer count. The submission is
+parsed once and every feature it uses is collected in a single walk of
+the tree. Matching ignores case, like the substring check it replaces.
+A submission that does not parse, or is nested too deeply to parse, is
+checked as text, so it still reaches the runner and gets its error
+reported.
+
+Compiled rules are cached per required_keywords text. Editing a
+question's keywords changes the text and therefore the cache key.
+"""
+import ast
+import functools
+import keyword
+
+# Soft keywords that only act as keywords in match statements
+SOFT_KEYWORDS = ('match', 'case')
+
+NODE_KEYWORDS = {
+    ast.For: ('for', 'in'),
+    ast.AsyncFor: ('async', 'for', 'in'),
+    ast.comprehension: ('for', 'in'),
+    ast.While: ('while',),
+    ast.If: ('if',),
+    ast.IfExp: ('if', 'else'),
+    ast.FunctionDef: ('def',),
+    ast.AsyncFunctionDef: ('async', 'def'),
+    ast.ClassDef: ('class',),
+    ast.Return: ('return',),
+    ast.Lambda: ('lambda',),
+    ast.Import: ('import',),
+    ast.ImportFrom: ('from', 'import'),
+    ast.Try: ('try',),
+    ast.ExceptHandler: ('except',),
+    ast.With: ('with',),
+    ast.AsyncWith: ('async', 'with'),
+    ast.Yield: ('yield',),
+    ast.YieldFrom: ('yield', 'from'),
+    ast.Await: ('await',),
+    ast.Break: ('break',),
+    ast.Continue: ('continue',),
+    ast.Pass: ('pass',),
+    ast.Raise: ('raise',),
+    ast.Assert: ('assert',),
+    ast.Delete: ('del',),
+    ast.Global: ('global',),
+    ast.Nonlocal: ('nonlocal',),
+    ast.And: ('and',),
+    ast.Or: ('or',),
+    ast.Not: ('not',),
+    ast.In: ('in',),
+    ast.NotIn: ('not', 'in'),
+    ast.Is: ('is',),
+    ast.IsNot: ('is', 'not'),
+    ast.Match: ('match',),
+    ast.match_case: ('case',),
+}
+if hasattr(ast, 'TryStar'):
+    NODE_KEYWORDS[ast.TryStar] = ('try',)
+
+CONSTANT_KEYWORDS = {None: 'none', True: 'true', False: 'false'}
+
+
+def _keywords(node):
+    """Keywords spelled out by a node beyond those of its type."""
+    if isinstance(node, (ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try)) and node.orelse:
+        if isinstance(node, ast.If) and len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+            yield 'elif'
+        else:
+            yield 'else'
+    if isinstance(node, (ast.Try, getattr(ast, 'TryStar', ast.Try))) and node.finalbody:
+        yield 'finally'
+    if isinstance(node, ast.comprehension) and node.ifs:
+        yield 'if'
+    if isinstance(node, ast.comprehension) and node.is_async:
+        yield 'async'
+    if isinstance(node, ast.Raise) and node.cause is not None:
+        yield 'from'
+    if (isinstance(node, ast.alias) and node.asname
+            or isinstance(node, ast.withitem) and node.optional_vars is not None
+            or isinstance(node, ast.ExceptHandler) and node.name
+            or isinstance(node, ast.MatchAs) and node.pattern is not None):
+        yield 'as'
+    if isinstance(node, ast.Constant) and type(node.value) in (bool, type(None)):
+        yield CONSTANT_KEYWORDS[node.value]
+
+
+def _names(node):
+    """Identifiers a node uses, defines or imports."""
+    if isinstance(node, ast.Name):
+        yield node.id
+    elif isinstance(node, ast.Attribute):
+        yield node.attr
+    elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        yield node.name
+    elif isinstance(node, ast.arg):
+        yield node.arg
+    elif isinstance(node, ast.keyword) and node.arg:
+        yield node.arg
+    elif isinstance(node, ast.alias):
+        yield from node.name.split('.')
+        if node.asname:
+            yield node.asname
+    elif isinstance(node, ast.ImportFrom) and node.module:
+        yield from node.module.split('.')
+    elif isinstance(node, (ast.Global, ast.Nonlocal)):
+        yield from node.names
+    elif isinstance(node, ast.ExceptHandler) and node.name:
+        yield node.name
+    elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+        yield node.name
+
+
+def collect_features(tree):
+    """Every ('keyword' | 'name' | 'call', value) the tree uses, in one walk."""
+    features = set()
+    for node in ast.walk(tree):
+        for word in NODE_KEYWORDS.get(type(node), ()):
+            features.add(('keyword', word))
+        for word in _keywords(node):
+            features.add(('keyword', word))
+        for name in _names(node):
+            features.add(('name', name.lower()))
+        if isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name):
+                features.add(('call', func.id.lower()))
+            elif isinstance(func, ast.Attribute):
+                features.add(('call', func.attr.lower()))
+    return features
+
+
+def compile_rule(word):
+    if word.endswith('()') and word[:-2].isidentifier():
+        return ('call', word[:-2])
+    if keyword.iskeyword(word) or keyword.iskeyword(word.capitalize()) or word in SOFT_KEYWORDS:
+        return ('keyword', word)
+    if word.isidentifier():
+        return ('name', word)
+    return ('text', word)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_rules(required_keywords):
+    """((keyword, rule), ...) for a required_keywords value, lowercased."""
+    words = [k.strip().lower() for k in required_keywords.split(',') if k.strip()]
+    return tuple((word, compile_rule(word)) for word in words)
+
+
+def missing_keywords(code, required_keywords):
+    """The required keywords the code does not use, in the order given."""
+    rules = compile_rules(required_keywords or '')
+    if not rules:
+        return []
+    try:
+        features = collect_features(ast.parse(code))
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        features = None
+    code_lower = code.lower()
+    missing = []
+    for word, rule in rules:
+        if features is None or rule[0] == 'text':
+            found = word in code_lower
+        else:
+            found = rule in features
+        if not found:
+            missing.append(word)
+    return missing
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from api.progress import recompute_topic_progress
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every TopicProgress completed_count and completion flag from UserProgress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int)
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of users rebuilt per batch'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or list(User.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        changed = 0
+        for start in range(0, len(user_ids), batch_size):
+            changed += recompute_topic_progress(user_ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {len(user_ids)} user(s): {changed} topic progress row(s) created or changed'
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Question
+from api.regrade import format_report, regrade_questions
+
+
+class Command(BaseCommand):
+    help = 'Regrade every stored submission for the given questions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('question_ids', nargs='*', type=int)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Regrade submissions for every question'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Number of interpreter workers to run in parallel'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Submissions graded and saved per batch'
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            questions = list(Question.objects.all())
+        elif options['question_ids']:
+            questions = list(Question.objects.filter(id__in=options['question_ids']))
+            missing = set(options['question_ids']) - {q.id for q in questions}
+            if missing:
+                raise CommandError(f'Question(s) not found: {", ".join(map(str, sorted(missing)))}')
+        else:
+            raise CommandError('Pass question ids or --all')
+
+        def on_progress(done, total):
+            if done % 100 == 0 or done == total:
+                self.stdout.write(f'  {done}/{total}')
+
+        report = regrade_questions(
+            questions, workers=options['workers'], on_progress=on_progress, chunk_size=options['chunk_size']
+        )
+        self.stdout.write(self.style.SUCCESS(format_report(report)))
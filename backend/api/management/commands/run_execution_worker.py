@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import claim_jobs, get_setting, requeue_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Drain the code execution job queue with bounded concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help='Maximum number of jobs executed at once'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is empty instead of polling'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency'] or get_setting('CONCURRENCY')
+        poll_interval = get_setting('POLL_INTERVAL')
+
+        self.stdout.write(f'Execution worker started (concurrency={concurrency})')
+
+        running = set()
+        next_requeue = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    # Also picks up jobs of workers that died while this one runs
+                    if time.monotonic() >= next_requeue:
+                        requeued = requeue_stale_jobs()
+                        if requeued:
+                            self.stdout.write(f'Requeued {requeued} stale job(s)')
+                        next_requeue = time.monotonic() + get_setting('STALE_AFTER')
+                    free = concurrency - len(running)
+                    if free > 0:
+                        for job_id in claim_jobs(free):
+                            running.add(executor.submit(run_job, job_id))
+
+                    if not running:
+                        if options['once']:
+                            break
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.exception():
+                            self.stderr.write(f'Job failed: {future.exception()}')
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping, waiting for running jobs...')
@@ -0,0 +1,329 @@
+"""
+Execution metrics in the Prometheus text format.
+
+Every process keeps its counters, gauges and histograms in memory and a
+background thread writes them to DIRECTORY/<pid>.json about once per
+FLUSH_INTERVAL. The /metrics view adds up the files of all processes, so
+the numbers are correct behind several gunicorn workers. Counters and
+histograms of processes that have exited are folded into archived.json
+and keep counting; their gauges are dropped.
+"""
+import atexit
+from contextlib import contextmanager
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process, nothing to lock against
+    fcntl = None
+
+DEFAULTS = {
+    'ENABLED': True,
+    'DIRECTORY': os.path.join(tempfile.gettempdir(), 'pylearn-metrics'),
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': '',
+}
+
+ARCHIVE_FILE = 'archived.json'
+LOCK_FILE = '.lock'
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def get_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+_registry = {}
+_values = {}
+_lock = threading.Lock()
+_flusher_pid = None
+_dirty = False
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} takes labels {self.labelnames}, got {tuple(labels)}')
+        return (self.name, tuple((name, str(labels[name])) for name in self.labelnames))
+
+    def _update(self, labels, update):
+        global _dirty
+        if not get_setting('ENABLED'):
+            return
+        key = self._key(labels)
+        _ensure_flusher()
+        with _lock:
+            _values[key] = update(_values.get(key))
+            _dirty = True
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda value: (value or 0) + amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        self._update(labels, lambda value: (value or 0) + amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        self._update(labels, lambda _: value)
+
+    @contextmanager
+    def track(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        def update(current):
+            current = current or {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            current['buckets'][index] += 1
+            current['sum'] += value
+            current['count'] += 1
+            return current
+        self._update(labels, update)
+
+
+def _ensure_flusher():
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        if _flusher_pid is not None:
+            # Forked from a process that already counted: start this one from zero
+            _values.clear()
+        _flusher_pid = os.getpid()
+    thread = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+    thread.start()
+
+
+def _flush_loop():
+    pid = os.getpid()
+    while _flusher_pid == pid:
+        time.sleep(get_setting('FLUSH_INTERVAL'))
+        flush()
+
+
+def _snapshot():
+    return [[name, [list(label) for label in labels], value] for (name, labels), value in _values.items()]
+
+
+def _write_json(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def flush():
+    """Write this process's values to its file if they changed."""
+    global _dirty
+    if _flusher_pid != os.getpid():
+        return
+    with _lock:
+        if not _dirty:
+            return
+        data = {'pid': os.getpid(), 'values': _snapshot()}
+        _dirty = False
+    directory = get_setting('DIRECTORY')
+    os.makedirs(directory, exist_ok=True)
+    _write_json(os.path.join(directory, f'{os.getpid()}.json'), data)
+
+
+atexit.register(flush)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(totals, values, include_gauges):
+    for name, labels, value in values:
+        metric = _registry.get(name)
+        if metric is None or (metric.kind == 'gauge' and not include_gauges):
+            continue
+        key = (name, tuple(tuple(label) for label in labels))
+        current = totals.get(key)
+        if metric.kind == 'histogram':
+            if current is None or len(current['buckets']) != len(value['buckets']):
+                totals[key] = {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']}
+            else:
+                current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                current['sum'] += value['sum']
+                current['count'] += value['count']
+        else:
+            totals[key] = (current or 0) + value
+
+
+def collect():
+    """Return {(name, labels): value} summed over every process."""
+    flush()
+    directory = get_setting('DIRECTORY')
+    os.makedirs(directory, exist_ok=True)
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    with open(os.path.join(directory, LOCK_FILE), 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = _read(archive_path) or {'values': []}
+        archived = {}
+        _merge(archived, archive['values'], include_gauges=False)
+        totals = {}
+        dead = []
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename == ARCHIVE_FILE:
+                continue
+            data = _read(os.path.join(directory, filename))
+            if data is None:
+                continue
+            if _pid_alive(data['pid']):
+                _merge(totals, data['values'], include_gauges=True)
+            else:
+                _merge(archived, data['values'], include_gauges=False)
+                dead.append(filename)
+        if dead:
+            _write_json(archive_path, {'values': [
+                [name, [list(label) for label in labels], value] for (name, labels), value in archived.items()
+            ]})
+            for filename in dead:
+                os.remove(os.path.join(directory, filename))
+    _merge(totals, [[name, labels, value] for (name, labels), value in archived.items()], include_gauges=False)
+    return totals
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Render the aggregated metrics in the Prometheus text format 0.0.4."""
+    totals = collect()
+    lines = []
+    for metric in _registry.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for (name, labels), value in sorted(totals.items()):
+            if name != metric.name:
+                continue
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (math.inf,), value['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_value(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value["sum"])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+EXECUTIONS = Counter(
+    'pylearn_executions_total',
+    'Code executions by backend and outcome (ok, error, diverged or the limit that stopped the run).',
+    ('backend', 'outcome')
+)
+REJECTED = Counter(
+    'pylearn_executions_rejected_total',
+    'Submissions rejected by static validation before a process was started, by reason.',
+    ('reason',)
+)
+ADMISSION_REJECTED = Counter(
+    'pylearn_admission_rejected_total',
+    'Execution requests refused with 429, by reason (rate or capacity).',
+    ('reason',)
+)
+EXECUTIONS_IN_FLIGHT = Gauge(
+    'pylearn_executions_in_flight',
+    'Code executions currently running or waiting for a worker.'
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    'pylearn_execution_queue_wait_seconds',
+    'Time a run waited for a free worker pool slot.'
+)
+SPAWN_SECONDS = Histogram(
+    'pylearn_execution_spawn_seconds',
+    'Start-up overhead: cold is a new worker interpreter starting, fork is the per-run fork and IPC.',
+    ('kind',)
+)
+RUN_SECONDS = Histogram(
+    'pylearn_execution_run_seconds',
+    'Time the submission itself ran.',
+    ('backend',)
+)
+OUTPUT_BYTES = Histogram(
+    'pylearn_execution_output_bytes',
+    'Size of stdout plus stderr of a run.',
+    buckets=BYTES_BUCKETS
+)
+POOL_SIZE = Gauge(
+    'pylearn_worker_pool_size',
+    'Worker pool slots, summed over processes.'
+)
+POOL_BUSY = Gauge(
+    'pylearn_worker_pool_busy',
+    'Worker pool slots in use, summed over processes.'
+)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_executionjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.TextField()),
+                ('verdict', models.CharField(choices=[('passed', 'Passed'), ('failed', 'Wrong output'), ('error', 'Error'), ('timeout', 'Timed out'), ('limit', 'Resource limit'), ('missing_keywords', 'Missing keywords')], max_length=20)),
+                ('runtime', models.FloatField(blank=True, help_text='Execution time in seconds', null=True)),
+                ('output_size', models.IntegerField(default=0, help_text='Bytes of stdout and stderr')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='api.question')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'question', '-created_at'], name='api_submiss_user_id_1316f0_idx')],
+            },
+        ),
+    ]
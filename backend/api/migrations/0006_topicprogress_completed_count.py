@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_completed_count(apps, schema_editor):
+    UserProgress = apps.get_model('api', 'UserProgress')
+    TopicProgress = apps.get_model('api', 'TopicProgress')
+    counts = (
+        UserProgress.objects.filter(completed=True)
+        .values('user_id', 'question__topic_id')
+        .annotate(total=Count('id'))
+        .values_list('user_id', 'question__topic_id', 'total')
+    )
+    existing = {(tp.user_id, tp.topic_id): tp for tp in TopicProgress.objects.all()}
+    to_create = []
+    to_update = []
+    for user_id, topic_id, total in counts:
+        progress = existing.get((user_id, topic_id))
+        if progress is None:
+            to_create.append(TopicProgress(
+                user_id=user_id,
+                topic_id=topic_id,
+                is_unlocked=False,
+                completed_count=total
+            ))
+        else:
+            progress.completed_count = total
+            to_update.append(progress)
+    TopicProgress.objects.bulk_create(to_create, batch_size=500)
+    TopicProgress.objects.bulk_update(to_update, ['completed_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_submission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topicprogress',
+            name='completed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_completed_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_topicprogress_completed_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['topic', 'order'], name='question_topic_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topicprogress',
+            index=models.Index(fields=['user', 'topic', 'is_unlocked', 'completed_count'], name='topicprogress_user_cover_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(condition=models.Q(('completed', True)), fields=['user', 'question'], name='userprogress_completed_idx'),
+        ),
+    ]
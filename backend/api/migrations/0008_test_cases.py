@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_progress_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='fail_fast',
+            field=models.BooleanField(default=True, help_text='Stop grading at the first failing test case'),
+        ),
+        migrations.CreateModel(
+            name='TestCase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stdin', models.TextField(blank=True, help_text="Fed to the program's standard input")),
+                ('expected_output', models.TextField()),
+                ('hidden', models.BooleanField(default=False, help_text='Learners only see whether a hidden case passed, not its input and output')),
+                ('order', models.IntegerField(default=0)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='test_cases', to='api.question')),
+            ],
+            options={
+                'ordering': ['order', 'id'],
+            },
+        ),
+    ]
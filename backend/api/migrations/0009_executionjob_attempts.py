@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_test_cases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='executionjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
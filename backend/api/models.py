@@ -38,13 +38,43 @@ class Question(models.Model):
         help_text="Hint to show user about what to use (e.g., 'Use a for loop')"
     )
 
+    # Only used when the question has test cases
+    fail_fast = models.BooleanField(
+        default=True,
+        help_text="Stop grading at the first failing test case"
+    )
+
     class Meta:
         ordering = ['order']
+        indexes = [
+            models.Index(fields=['topic', 'order'], name='question_topic_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.topic.title} - {self.title}"
 
 
+class TestCase(models.Model):
+    """
+    One stdin/expected output pair. A question with test cases is graded
+    against all of them instead of its expected_output.
+    """
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='test_cases')
+    stdin = models.TextField(blank=True, help_text="Fed to the program's standard input")
+    expected_output = models.TextField()
+    hidden = models.BooleanField(
+        default=False,
+        help_text="Learners only see whether a hidden case passed, not its input and output"
+    )
+    order = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['order', 'id']
+
+    def __str__(self):
+        return f"{self.question.title} - case {self.order}"
+
+
 class UserProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='progress')
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
@@ -59,6 +89,14 @@ class UserProgress(models.Model):
 
     class Meta:
         unique_together = ['user', 'question']
+        indexes = [
+            # Completion counts only ever look at completed rows
+            models.Index(
+                fields=['user', 'question'],
+                condition=models.Q(completed=True),
+                name='userprogress_completed_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.question.title}"
@@ -69,9 +107,86 @@ class TopicProgress(models.Model):
     topic = models.ForeignKey(Topic, on_delete=models.CASCADE)
     is_unlocked = models.BooleanField(default=True)
     is_completed = models.BooleanField(default=False)
+    # Completed questions of this topic, kept in step with UserProgress
+    completed_count = models.IntegerField(default=0)
 
     class Meta:
         unique_together = ['user', 'topic']
+        indexes = [
+            # Covers topic_progress_map and the unlock check in get_question
+            models.Index(
+                fields=['user', 'topic', 'is_unlocked', 'completed_count'],
+                name='topicprogress_user_cover_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.topic.title}"
+
+
+class ExecutionJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='execution_jobs')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    code = models.TextField()
+    # Counted when the job is queued, so a requeued job is not counted twice
+    attempts = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - {self.user.username} - {self.status}"
+
+
+class Submission(models.Model):
+    """Append-only history of every graded submission."""
+    VERDICT_PASSED = 'passed'
+    VERDICT_FAILED = 'failed'
+    VERDICT_ERROR = 'error'
+    VERDICT_TIMEOUT = 'timeout'
+    VERDICT_LIMIT = 'limit'
+    VERDICT_MISSING_KEYWORDS = 'missing_keywords'
+    VERDICT_CHOICES = [
+        (VERDICT_PASSED, 'Passed'),
+        (VERDICT_FAILED, 'Wrong output'),
+        (VERDICT_ERROR, 'Error'),
+        (VERDICT_TIMEOUT, 'Timed out'),
+        (VERDICT_LIMIT, 'Resource limit'),
+        (VERDICT_MISSING_KEYWORDS, 'Missing keywords'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submissions')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='submissions')
+    code = models.TextField()
+    verdict = models.CharField(max_length=20, choices=VERDICT_CHOICES)
+    runtime = models.FloatField(null=True, blank=True, help_text="Execution time in seconds")
+    output_size = models.IntegerField(default=0, help_text="Bytes of stdout and stderr")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'question', '-created_at']),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.topic.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.question.title} - {self.verdict}"
@@ -0,0 +1,229 @@
+"""
+Per-request profiling.
+
+ProfilingMiddleware records each request's wall time, DB query count and
+time, time spent running submissions and response size. It adds them to
+the response as a Server-Timing header and logs them as one JSON line on
+the 'api.profiling' logger. A SAMPLE_RATE share of requests also runs
+under cProfile (or pyinstrument), and the profiles of the SLOWEST sampled
+requests in each process are kept in DIRECTORY.
+
+Under ASGI a sampled profile also covers whatever else the event loop
+ran during the request.
+
+The middleware removes itself unless PROFILING['ENABLED'] is set.
+"""
+from contextlib import ExitStack, contextmanager
+import contextvars
+import cProfile
+import heapq
+import importlib.util
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('api.profiling')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.0,
+    'PROFILER': 'cprofile',
+    'SLOWEST': 20,
+    'DIRECTORY': os.path.join(tempfile.gettempdir(), 'pylearn-profiles'),
+}
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.timings = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - started
+            self.queries += 1
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's profile."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[name] = profile.timings.get(name, 0.0) + time.perf_counter() - started
+
+
+class SlowestProfiles:
+    """Keeps the profile files of the slowest requests, deleting the rest."""
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+        self._heap = []
+        self._count = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def offer(self, duration, request, write):
+        with self._lock:
+            if len(self._heap) >= self.keep and duration <= self._heap[0][0]:
+                return None
+            self._count += 1
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+            name = f'{duration * 1000:09.1f}ms-{request.method}-{slug}-{os.getpid()}-{self._count}'
+            path = write(os.path.join(self.directory, name))
+            heapq.heappush(self._heap, (duration, path))
+            if len(self._heap) > self.keep:
+                _, evicted = heapq.heappop(self._heap)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+            return path
+
+
+class _CProfiler:
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def write(self, path):
+        self.profiler.dump_stats(path + '.prof')
+        return path + '.prof'
+
+
+class _Pyinstrument:
+    def __init__(self):
+        from pyinstrument import Profiler
+        self.profiler = Profiler()
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def write(self, path):
+        with open(path + '.html', 'w') as f:
+            f.write(self.profiler.output_html())
+        return path + '.html'
+
+
+PROFILERS = {
+    'cprofile': _CProfiler,
+    'pyinstrument': _Pyinstrument,
+}
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = get_setting('SAMPLE_RATE')
+        self.profiler_class = PROFILERS.get(get_setting('PROFILER'))
+        if self.profiler_class is None:
+            raise ImproperlyConfigured(f"Unknown PROFILING['PROFILER']: {get_setting('PROFILER')!r}")
+        if self.profiler_class is _Pyinstrument and importlib.util.find_spec('pyinstrument') is None:
+            raise ImproperlyConfigured("PROFILING['PROFILER'] is 'pyinstrument' but it is not installed")
+        self.slowest = SlowestProfiles(get_setting('DIRECTORY'), get_setting('SLOWEST')) if self.sample_rate else None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile, profiler = self._start()
+        started = time.perf_counter()
+        with self._active(profile, profiler):
+            response = self.get_response(request)
+        return self._finish(request, response, profile, profiler, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        profile, profiler = self._start()
+        started = time.perf_counter()
+        with self._active(profile, profiler):
+            response = await self.get_response(request)
+        return self._finish(request, response, profile, profiler, time.perf_counter() - started)
+
+    def _start(self):
+        profiler = None
+        if self.sample_rate and random.random() < self.sample_rate:
+            profiler = self.profiler_class()
+        return RequestProfile(), profiler
+
+    @contextmanager
+    def _active(self, profile, profiler):
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                if profiler is not None:
+                    profiler.start()
+                try:
+                    yield
+                finally:
+                    if profiler is not None:
+                        profiler.stop()
+        finally:
+            _current.reset(token)
+
+    def _finish(self, request, response, profile, profiler, duration):
+        profile_path = None
+        if profiler is not None:
+            profile_path = self.slowest.offer(duration, request, profiler.write)
+
+        executor = profile.timings.get('executor', 0.0)
+        size = None if response.streaming else len(response.content)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={profile.query_time * 1000:.1f};desc="{profile.queries} queries"',
+            f'exec;dur={executor * 1000:.1f}',
+            f'app;dur={max(duration - profile.query_time - executor, 0) * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ])
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': profile.queries,
+            'db_ms': round(profile.query_time * 1000, 2),
+            'executor_ms': round(executor * 1000, 2),
+            'response_bytes': size,
+            'profile': profile_path,
+        }))
+        return response
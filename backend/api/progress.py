@@ -0,0 +1,205 @@
+"""
+Per-user progress aggregation.
+
+Builds every per-topic count and flag the topic serializers and the
+dashboard need in a fixed number of queries, instead of several COUNT
+queries per topic. Completed question counts are materialized on
+TopicProgress.completed_count: grading updates it when a question is
+first completed, and recompute_topic_progress rebuilds it.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .curriculum import get_curriculum
+from .models import UserProgress, TopicProgress
+
+PROGRESS_VERSION_KEY = 'progress:version:{}'
+
+EMPTY_QUESTION_PROGRESS = {
+    'completed': False,
+    'submitted_code': '',
+    'attempts': 0,
+}
+
+
+def topic_progress_map(user):
+    """
+    Return {topic_id: {...}} for every topic, in topic order, with
+    questions_count, completed_count, is_completed and is_unlocked.
+    Runs one query regardless of the number of topics; the course
+    structure comes from the curriculum snapshot.
+    """
+    curriculum = get_curriculum()
+
+    completed = {}
+    unlocked = set()
+    if user is not None and user.is_authenticated:
+        rows = TopicProgress.objects.filter(user=user).values_list('topic_id', 'is_unlocked', 'completed_count')
+        for topic_id, is_unlocked, completed_count in rows:
+            completed[topic_id] = completed_count
+            if is_unlocked:
+                unlocked.add(topic_id)
+    else:
+        # Anonymous users only see the first topic unlocked
+        user = None
+
+    progress = {}
+    for topic_id in curriculum.topic_ids:
+        questions_count = curriculum.questions_count[topic_id]
+        completed_count = completed.get(topic_id, 0)
+        progress[topic_id] = {
+            'questions_count': questions_count,
+            'completed_count': completed_count,
+            'is_completed': user is not None and questions_count > 0 and completed_count >= questions_count,
+            'is_unlocked': curriculum.is_first_topic(topic_id) or topic_id in unlocked,
+        }
+    return progress
+
+
+def get_topic_progress(context, topic):
+    """
+    Look up a topic's progress in serializer context, building the map
+    for the request user on first use so a list serializer shares it.
+    """
+    if 'topic_progress' not in context:
+        request = context.get('request')
+        context['topic_progress'] = topic_progress_map(request.user if request else None)
+    return context['topic_progress'].get(topic.id, {
+        'questions_count': 0,
+        'completed_count': 0,
+        'is_completed': False,
+        'is_unlocked': False,
+    })
+
+
+def question_progress_map(user, topic_id, with_code=True):
+    """
+    Return {question_id: {...}} with completed, submitted_code and attempts
+    for the user's progress rows in one topic, loaded in a single query.
+    Without `with_code` the submitted_code column is not read.
+    """
+    if user is None or not user.is_authenticated:
+        return {}
+    fields = ['question_id', 'completed', 'attempts']
+    if with_code:
+        fields.append('submitted_code')
+    rows = UserProgress.objects.filter(
+        user=user,
+        question__topic_id=topic_id
+    ).values(*fields)
+    return {row.pop('question_id'): row for row in rows}
+
+
+def get_question_progress(context, question, with_code=True):
+    """
+    Look up a question's progress in serializer context. Rows are loaded
+    per topic, so all questions of a topic detail share one query.
+    Pass `with_code=False` when the response leaves submitted_code out.
+    """
+    by_topic = context.setdefault('question_progress', {})
+    loaded = by_topic.get(question.topic_id)
+    if loaded is None or (with_code and not loaded[0]):
+        request = context.get('request')
+        by_topic[question.topic_id] = (with_code, question_progress_map(
+            request.user if request else None,
+            question.topic_id,
+            with_code
+        ))
+    return by_topic[question.topic_id][1].get(question.id, EMPTY_QUESTION_PROGRESS)
+
+
+def recompute_topic_progress(user_ids):
+    """
+    Rebuild TopicProgress completion counts and flags for the given users
+    from their UserProgress rows, and unlock the topic after every
+    completed one. Topics are never locked again. Runs a fixed number of
+    queries and returns the number of rows created or changed.
+    """
+    curriculum = get_curriculum()
+    user_ids = set(user_ids)
+
+    completed = {}
+    rows = (
+        UserProgress.objects.filter(user_id__in=user_ids, completed=True)
+        .values('user_id', 'question__topic_id')
+        .annotate(total=Count('id'))
+        .values_list('user_id', 'question__topic_id', 'total')
+    )
+    for user_id, topic_id, total in rows:
+        completed[(user_id, topic_id)] = total
+
+    existing = {
+        (tp.user_id, tp.topic_id): tp
+        for tp in TopicProgress.objects.filter(user_id__in=user_ids)
+    }
+
+    to_create = []
+    to_update = []
+    for user_id in user_ids:
+        completed_topics = {
+            topic_id for topic_id in curriculum.topic_ids
+            if curriculum.questions_count[topic_id] > 0
+            and completed.get((user_id, topic_id), 0) >= curriculum.questions_count[topic_id]
+        }
+        unlocked_topics = completed_topics | {
+            curriculum.next_topic_ids[topic_id] for topic_id in completed_topics
+        }
+        unlocked_topics.add(curriculum.first_topic_id)
+
+        for topic_id in curriculum.topic_ids:
+            is_completed = topic_id in completed_topics
+            should_unlock = topic_id in unlocked_topics
+            completed_count = completed.get((user_id, topic_id), 0)
+            progress = existing.get((user_id, topic_id))
+            if progress is None:
+                if should_unlock or completed_count:
+                    to_create.append(TopicProgress(
+                        user_id=user_id,
+                        topic_id=topic_id,
+                        is_unlocked=should_unlock,
+                        is_completed=is_completed,
+                        completed_count=completed_count
+                    ))
+                continue
+
+            is_unlocked = progress.is_unlocked or should_unlock
+            current = (progress.is_unlocked, progress.is_completed, progress.completed_count)
+            if current != (is_unlocked, is_completed, completed_count):
+                progress.is_unlocked = is_unlocked
+                progress.is_completed = is_completed
+                progress.completed_count = completed_count
+                to_update.append(progress)
+
+    TopicProgress.objects.bulk_create(to_create, batch_size=500)
+    TopicProgress.objects.bulk_update(
+        to_update,
+        ['is_unlocked', 'is_completed', 'completed_count'],
+        batch_size=500
+    )
+    bump_progress_version(*user_ids)
+    return len(to_create) + len(to_update)
+
+
+def progress_version(user_id):
+    """
+    Version of everything progress-related shown to this user, used in
+    ETags. Changes whenever bump_progress_version is called for the user.
+    """
+    key = PROGRESS_VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_progress_version(*user_ids):
+    """Publish new progress versions once the current transaction commits."""
+    def publish():
+        now = time.time_ns()
+        cache.set_many({PROGRESS_VERSION_KEY.format(user_id): now for user_id in user_ids}, None)
+    if user_ids:
+        transaction.on_commit(publish)
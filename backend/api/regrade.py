@@ -0,0 +1,183 @@
+"""
+Bulk regrading of stored submissions.
+
+Used by the regrade_questions management command after a question's
+expected_output, test cases or required_keywords are fixed. The
+QuestionAdmin action starts that command in a separate process, so a
+large regrade is not bound by the admin request's timeout.
+Every stored submitted_code for the questions is run again on a
+dedicated worker pool, CHUNK_SIZE submissions at a time. Each chunk is
+read with its own keyset-paginated query, so the submitted code of only
+one chunk is held in memory at a time. After each
+chunk its changed completed flags are written with bulk_update and topic
+progress is recomputed for its users, so an interrupted regrade keeps
+the work already done. A submission whose grading raises keeps its
+current flag and is counted in the report's failures.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .grading import check_required_keywords, run_submission, submission_passed
+from .models import TestCase, UserProgress
+from .progress import recompute_topic_progress
+from . import runner
+
+DEFAULTS = {
+    'CHUNK_SIZE': 500,
+    # Output of regrades started from the admin
+    'LOG_FILE': None,
+}
+
+# Failures listed individually in the report; the rest are only counted
+MAX_ERRORS = 20
+
+
+def get_setting(name):
+    return getattr(settings, 'REGRADE', {}).get(name, DEFAULTS[name])
+
+
+def _grade(progress, question, test_cases, pool):
+    is_valid, _ = check_required_keywords(progress.submitted_code, question.required_keywords)
+    if not is_valid:
+        return False
+    return submission_passed(test_cases, run_submission(progress.submitted_code, question, test_cases, pool=pool))
+
+
+def regrade_questions(questions, workers=None, on_progress=None, chunk_size=None):
+    """
+    Regrade every stored submission of `questions`. `on_progress` is
+    called as on_progress(done, total) while grading. Returns a report
+    dict with counts and throughput.
+    """
+    questions = {question.id: question for question in questions}
+    test_cases = {}
+    for test_case in TestCase.objects.filter(question_id__in=questions):
+        test_cases.setdefault(test_case.question_id, []).append(test_case)
+    submissions = (
+        UserProgress.objects.filter(question_id__in=questions)
+        .exclude(submitted_code='')
+        .only('id', 'user_id', 'question_id', 'submitted_code', 'completed', 'completed_at')
+    )
+    total = submissions.count()
+    workers = workers or runner.get_setting('POOL_SIZE')
+    chunk_size = chunk_size or get_setting('CHUNK_SIZE')
+    pool = runner.WorkerPool(workers, runner.get_setting('MAX_RUNS_PER_WORKER'))
+    report = {
+        'submissions': 0,
+        'changed': 0,
+        'newly_passed': 0,
+        'newly_failed': 0,
+        'failed': 0,
+        'errors': [],
+        'topic_progress_updated': 0,
+    }
+    started = time.monotonic()
+
+    done = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk in _chunks(submissions, chunk_size):
+                futures = {
+                    executor.submit(
+                        _grade, progress, questions[progress.question_id], test_cases.get(progress.question_id), pool
+                    ): progress
+                    for progress in chunk
+                }
+                verdicts = {}
+                for future in as_completed(futures):
+                    progress = futures[future]
+                    try:
+                        verdicts[progress.id] = future.result()
+                    except Exception as e:
+                        report['failed'] += 1
+                        if len(report['errors']) < MAX_ERRORS:
+                            report['errors'].append(f'submission {progress.id}: {e!r}')
+                    done += 1
+                    if on_progress:
+                        on_progress(done, total)
+                _save(chunk, verdicts, report)
+    finally:
+        pool.close()
+    elapsed = time.monotonic() - started
+
+    report['submissions'] = done
+    report['seconds'] = elapsed
+    report['per_second'] = done / elapsed if elapsed else 0.0
+    return report
+
+
+def _chunks(submissions, chunk_size):
+    """
+    Yield lists of up to chunk_size rows. Ordered by user so that most
+    users' topic progress is recomputed once, and paged by (user_id, id)
+    rather than OFFSET.
+    """
+    submissions = submissions.order_by('user_id', 'id')
+    last = None
+    while True:
+        page = submissions
+        if last is not None:
+            page = page.filter(Q(user_id__gt=last.user_id) | Q(user_id=last.user_id, id__gt=last.id))
+        chunk = list(page[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+
+
+def _save(chunk, verdicts, report):
+    """Write the chunk's changed flags and recompute its users' topic progress."""
+    now = timezone.now()
+    changed = []
+    for progress in chunk:
+        passed = verdicts.get(progress.id, progress.completed)
+        if passed == progress.completed:
+            continue
+        progress.completed = passed
+        progress.completed_at = now if passed else None
+        changed.append(progress)
+    UserProgress.objects.bulk_update(changed, ['completed', 'completed_at'], batch_size=500)
+    report['topic_progress_updated'] += recompute_topic_progress({progress.user_id for progress in chunk})
+    report['changed'] += len(changed)
+    report['newly_passed'] += sum(1 for progress in changed if progress.completed)
+    report['newly_failed'] += sum(1 for progress in changed if not progress.completed)
+
+
+def start_regrade(questions):
+    """
+    Run the regrade_questions command for `questions` in a new process
+    that outlives the request. Its output is appended to LOG_FILE, or
+    discarded when that is not set. Returns the process id.
+    """
+    log_file = get_setting('LOG_FILE')
+    output = open(log_file, 'ab') if log_file else subprocess.DEVNULL
+    try:
+        process = subprocess.Popen(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'regrade_questions',
+             *[str(question.id) for question in questions]],
+            stdin=subprocess.DEVNULL,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    finally:
+        if log_file:
+            output.close()
+    return process.pid
+
+
+def format_report(report):
+    return (
+        f"Regraded {report['submissions']} submission(s) in {report['seconds']:.2f}s "
+        f"({report['per_second']:.1f}/s): {report['newly_passed']} now pass, "
+        f"{report['newly_failed']} now fail, "
+        f"{report['topic_progress_updated']} topic progress row(s) updated, "
+        f"{report['failed']} could not be graded"
+    ) + ''.join(f'\n  {error}' for error in report['errors'])
@@ -0,0 +1,244 @@
+"""
+Result cache for deterministic submissions.
+
+Many students submit byte-identical solutions, so execution results are
+kept in a per-process LRU keyed by question, a hash of the normalized
+code and the interpreter version. The key also hashes the question's
+expected_output and required_keywords, and its test cases when it has
+any, so editing them makes old entries unreachable and they age out of
+the LRU. Code is validated before it is hashed, so a rejected
+submission never reaches the cache.
+"""
+from collections import OrderedDict
+import ast
+import hashlib
+import sys
+import threading
+
+from django.conf import settings
+
+from . import async_runner
+from .runner import ExecutionResult, execute, execute_cases, rejection
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 5000,
+    'MAX_ENTRY_BYTES': 64 * 1024,
+    'NONDETERMINISTIC_MODULES': ('random', 'time', 'datetime', 'uuid', 'secrets', 'os', 'sys'),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'RESULT_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def normalize_code(code):
+    """Ignore line endings and trailing blank space, which never change the result."""
+    return code.replace('\r\n', '\n').replace('\r', '\n').rstrip()
+
+
+def is_cacheable(code):
+    """
+    Code importing clocks, randomness or the environment is never cached,
+    nor code importing modules dynamically or that does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return False
+    modules = set(get_setting('NONDETERMINISTIC_MODULES'))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            names = [node.module] if node.module and node.level == 0 else []
+        elif isinstance(node, ast.Call):
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+            if name in ('__import__', 'import_module'):
+                return False
+            continue
+        else:
+            continue
+        if any(name.split('.')[0] in modules or name.split('.')[0] == 'importlib' for name in names):
+            return False
+    return True
+
+
+def make_key(code, question=None, cases=None):
+    code_hash = hashlib.sha256(normalize_code(code).encode('utf-8')).hexdigest()
+    if question is None:
+        return (None, '', code_hash, sys.version)
+    question_hash = hashlib.sha256(
+        f'{question.expected_output}\0{question.required_keywords}'.encode('utf-8')
+    )
+    if cases is not None:
+        question_hash.update(repr((question.fail_fast, cases)).encode('utf-8'))
+    return (question.id, question_hash.hexdigest(), code_hash, sys.version)
+
+
+class ResultCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(get_setting('MAX_ENTRIES'))
+        return _cache
+
+
+def lookup(code, question=None, cases=None):
+    """Return the cached entry for this submission, or None."""
+    if not get_setting('ENABLED') or not is_cacheable(code):
+        return None
+    return get_cache().get(make_key(code, question, cases))
+
+
+def store(code, result, question=None, passed=None):
+    """Cache an execution result and, for questions, its verdict."""
+    if not get_setting('ENABLED') or result.limit or not is_cacheable(code):
+        return
+    if len(result.stdout) + len(result.stderr) > get_setting('MAX_ENTRY_BYTES'):
+        return
+    get_cache().set(make_key(code, question), {
+        'stdout': result.stdout,
+        'stderr': result.stderr,
+        'returncode': result.returncode,
+        'diverged': result.diverged,
+        'passed': passed,
+    })
+
+
+def from_entry(entry):
+    """(result, verdict) of a cached entry."""
+    result = ExecutionResult(entry['stdout'], entry['stderr'], entry['returncode'], diverged=entry['diverged'])
+    return result, entry['passed']
+
+
+def grade_and_store(code, result, question, grade):
+    """Grade a fresh result, cache both and return (result, verdict)."""
+    passed = grade(result) if grade is not None else None
+    store(code, result, question, passed)
+    return result, passed
+
+
+def expected_output_of(question):
+    return question.expected_output if question is not None else None
+
+
+def execute_cached(code, question=None, grade=None, pool=None, checked=False):
+    """
+    Run code unless an identical submission was already run. `grade` maps
+    an ExecutionResult to a pass/fail verdict that is cached with it.
+    `checked` means the caller already took runner.rejection() of the
+    code. Returns (result, verdict).
+    """
+    rejected = None if checked else rejection(code)
+    if rejected is not None:
+        return rejected, grade(rejected) if grade is not None else None
+    entry = lookup(code, question)
+    if entry is not None:
+        return from_entry(entry)
+    result = execute(code, pool=pool, expected_output=expected_output_of(question), checked=True)
+    return grade_and_store(code, result, question, grade)
+
+
+async def aexecute_cached(code, question=None, grade=None, checked=False):
+    """execute_cached for async views: a miss runs through api.async_runner."""
+    rejected = None if checked else rejection(code)
+    if rejected is not None:
+        return rejected, grade(rejected) if grade is not None else None
+    entry = lookup(code, question)
+    if entry is not None:
+        return from_entry(entry)
+    result = await async_runner.execute(code, expected_output=expected_output_of(question), checked=True)
+    return grade_and_store(code, result, question, grade)
+
+
+def store_cases(code, results, question, cases):
+    if not get_setting('ENABLED') or any(r.limit for r in results) or not is_cacheable(code):
+        return
+    if sum(len(r.stdout) + len(r.stderr) for r in results) > get_setting('MAX_ENTRY_BYTES'):
+        return
+    get_cache().set(make_key(code, question, cases), {'cases': [
+        {'stdout': r.stdout, 'stderr': r.stderr, 'returncode': r.returncode, 'passed': r.passed,
+         'diverged': r.diverged}
+        for r in results
+    ]})
+
+
+def cases_from_entry(entry):
+    return [ExecutionResult(**case) for case in entry['cases']]
+
+
+def execute_cases_cached(code, question, cases, pool=None, checked=False):
+    """
+    Run code against a question's test cases (dicts with 'stdin' and
+    'expected_output') unless an identical submission was already run.
+    Returns a list of ExecutionResults with `passed` set.
+    """
+    rejected = None if checked else rejection(code, cases=True)
+    if rejected is not None:
+        return rejected
+    entry = lookup(code, question, cases)
+    if entry is not None:
+        return cases_from_entry(entry)
+    results = execute_cases(code, cases, question.fail_fast, pool=pool, checked=True)
+    store_cases(code, results, question, cases)
+    return results
+
+
+async def aexecute_cases_cached(code, question, cases, checked=False):
+    """execute_cases_cached for async views."""
+    rejected = None if checked else rejection(code, cases=True)
+    if rejected is not None:
+        return rejected
+    entry = lookup(code, question, cases)
+    if entry is not None:
+        return cases_from_entry(entry)
+    results = await async_runner.execute_cases(code, cases, question.fail_fast, checked=True)
+    store_cases(code, results, question, cases)
+    return results
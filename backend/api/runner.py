@@ -0,0 +1,546 @@
+"""
+Code execution for run_code and submit_code.
+
+Submissions are handed to a pool of pre-started interpreter workers
+(see runner_worker.py) so a request does not pay for interpreter startup
+or a temporary file. Each run is bounded by a wall-clock timeout, CPU,
+memory, process and file-size rlimits and a cap on captured output.
+Platforms without os.fork fall back to starting a fresh interpreter per
+run.
+
+Questions with test cases are graded by execute_cases: one round trip to
+one worker runs the code against every case's stdin and returns a
+verdict per case.
+
+When grading, the worker is sent the expected output as tokens and
+compares stdout as it is written, stopping the run at the first
+mismatch instead of capturing and normalizing all of it.
+"""
+import atexit
+import functools
+import json
+import os
+import queue
+import re
+import select
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .profiling import timed
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runner_worker.py')
+HEADER = struct.Struct('>I')
+# Seconds a new worker interpreter gets to start before it counts as failed
+WORKER_START_TIMEOUT = 10
+
+DEFAULTS = {
+    'POOL_SIZE': 4,
+    'MAX_RUNS_PER_WORKER': 200,
+    # Start the pool's workers with the first request instead of the first run
+    'PRESTART': True,
+    'TIMEOUT': 5,
+    # Per-run resource limits, None disables a limit
+    'CPU_TIME': 5,
+    'MEMORY': 256 * 1024 * 1024,
+    'MAX_PROCESSES': 0,
+    'FILE_SIZE': 1024 * 1024,
+    'MAX_OUTPUT': 1024 * 1024,
+    # Bytes of stdout kept for display when the worker compares it against the expected output
+    'OUTPUT_PREVIEW': 64 * 1024,
+}
+
+LIMIT_MESSAGES = {
+    'timeout': 'Code execution timed out',
+    'cpu': 'CPU time limit exceeded',
+    'memory': 'Memory limit exceeded',
+    'fsize': 'File size limit exceeded',
+    'output': 'Output limit exceeded',
+    'code_size': 'Code size limit exceeded',
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'CODE_RUNNER', {}).get(name, DEFAULTS[name])
+
+
+def normalize_output(text):
+    """Normalize output for comparison"""
+    if text is None:
+        return ""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+@functools.lru_cache(maxsize=1024)
+def expected_tokens(expected_output):
+    """
+    expected_output as the worker compares it: the whitespace-separated
+    tokens, which are equal exactly when the normalize_output texts are.
+    """
+    return tuple(expected_output.split())
+
+
+def get_limits():
+    return {
+        'cpu': get_setting('CPU_TIME'),
+        'memory': get_setting('MEMORY'),
+        'nproc': get_setting('MAX_PROCESSES'),
+        'fsize': get_setting('FILE_SIZE'),
+    }
+
+
+class ExecutionResult:
+    def __init__(self, stdout='', stderr='', returncode=0, timed_out=False, duration=0.0, limit=None, passed=None,
+                 diverged=False):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.duration = duration
+        # Name of the resource limit that stopped the run, if any
+        self.limit = limit
+        # Verdict when the worker compared the output; None otherwise
+        self.passed = passed
+        # Killed early because the output stopped matching; stdout is then a prefix
+        self.diverged = diverged
+
+    @classmethod
+    def timeout(cls, duration, **kwargs):
+        return cls(returncode=-9, timed_out=True, duration=duration, limit='timeout', **kwargs)
+
+    @property
+    def limit_message(self):
+        if self.limit == 'output':
+            return f"{LIMIT_MESSAGES['output']} (max {get_setting('MAX_OUTPUT')} bytes)"
+        if self.limit == 'code_size':
+            from .validation import get_setting as get_validation_setting
+            return f"{LIMIT_MESSAGES['code_size']} (max {get_validation_setting('MAX_CODE_SIZE')} bytes)"
+        return LIMIT_MESSAGES.get(self.limit)
+
+
+def make_request(code, timeout, cases=None, fail_fast=False, expected_output=None):
+    """
+    A runner_worker request; `cases` is a list of {'stdin', 'expected_output'}.
+    With `expected_output` or `cases` the worker grades the output itself.
+    """
+    request = {
+        'code': code,
+        'timeout': timeout,
+        'limits': get_limits(),
+        'max_output': get_setting('MAX_OUTPUT'),
+        'preview': get_setting('OUTPUT_PREVIEW'),
+    }
+    if expected_output is not None:
+        request['expected'] = expected_tokens(expected_output)
+    if cases is not None:
+        request['cases'] = [
+            {'stdin': case['stdin'], 'expected': expected_tokens(case['expected_output'])}
+            for case in cases
+        ]
+        request['fail_fast'] = fail_fast
+    return request
+
+
+def pool_result(data, started):
+    """The ExecutionResult for a runner_worker reply; None means no reply in time."""
+    if data is None:
+        return ExecutionResult.timeout(time.monotonic() - started)
+    return ExecutionResult(**data)
+
+
+def pool_case_results(data, started):
+    """pool_result for a request with cases: a result per case run."""
+    if data is None:
+        return [ExecutionResult.timeout(time.monotonic() - started, passed=False)]
+    return [ExecutionResult(**case) for case in data['cases']]
+
+
+def rejection(code, cases=False):
+    """
+    The result for code failing api.validation, shaped like a run of it:
+    an ExecutionResult, or for test cases a one-element list, like a run
+    that failed its first case. None when the code may run.
+    """
+    from .validation import validate
+    rejected = validate(code)
+    if rejected is not None and cases:
+        rejected.passed = False
+        return [rejected]
+    return rejected
+
+
+def prepare(code, timeout, cases=False, checked=False):
+    """
+    The checks every execute variant makes before running: returns
+    (rejection or None, timeout). `checked` skips validation for callers
+    that already took rejection() of the code.
+    """
+    rejected = None if checked else rejection(code, cases)
+    return rejected, get_setting('TIMEOUT') if timeout is None else timeout
+
+
+class WorkerError(Exception):
+    pass
+
+
+class WorkerTimeout(WorkerError):
+    pass
+
+
+class Worker:
+    """A warm interpreter process speaking the runner_worker protocol."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, '-u', WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+        self.started = time.monotonic()
+        self.runs = 0
+
+    def _read_exactly(self, size, deadline):
+        fd = self.proc.stdout.fileno()
+        data = b''
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise WorkerTimeout('Worker did not respond in time')
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise WorkerError('Worker exited unexpectedly')
+            data += chunk
+        return data
+
+    def _recv(self, deadline):
+        size = HEADER.unpack(self._read_exactly(HEADER.size, deadline))[0]
+        return json.loads(self._read_exactly(size, deadline).decode('utf-8'))
+
+    def wait_ready(self, timeout):
+        """Wait for the interpreter to start; returns the start-up time."""
+        self._recv(time.monotonic() + timeout)
+        return time.monotonic() - self.started
+
+    def run(self, request):
+        self.runs += 1
+        body = json.dumps(request).encode('utf-8')
+        message = HEADER.pack(len(body)) + body
+        try:
+            while message:
+                message = message[os.write(self.proc.stdin.fileno(), message):]
+        except OSError as e:
+            raise WorkerError(str(e))
+        # The worker enforces the timeout itself; allow some slack for the reply
+        return self._recv(time.monotonic() + request['timeout'] + 2)
+
+    def is_alive(self):
+        return self.proc.poll() is None
+
+    def stop(self):
+        if self.is_alive():
+            self.proc.kill()
+        self.proc.wait()
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of warm workers.
+
+    At most `size` runs execute at once; further callers wait for a free
+    worker. Workers are replaced after `max_runs` runs or on any failure.
+    With `prestart` the pool starts its workers in the background as it
+    is created, and a retired worker's replacement is started in the
+    background too, so runs do not wait for an interpreter to start.
+    """
+
+    def __init__(self, size, max_runs, prestart=False):
+        self.size = size
+        self.max_runs = max_runs
+        self.prestart = prestart
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._closed = False
+        self._lock = threading.Lock()
+        metrics.POOL_SIZE.inc(size)
+        if prestart:
+            self._start_in_background(size)
+
+    def _start_worker(self):
+        worker = Worker()
+        try:
+            metrics.SPAWN_SECONDS.observe(worker.wait_ready(WORKER_START_TIMEOUT), kind='cold')
+        except BaseException:
+            worker.stop()
+            raise
+        return worker
+
+    def _start_in_background(self, count):
+        def start():
+            for _ in range(count):
+                if self._closed:
+                    return
+                try:
+                    worker = self._start_worker()
+                except WorkerError:
+                    return
+                self._put_idle(worker)
+        threading.Thread(target=start, name='runner-prestart', daemon=True).start()
+
+    def _put_idle(self, worker):
+        with self._lock:
+            # Workers started on demand while the background ones were starting can overshoot the size
+            if self._closed or self._idle.qsize() >= self.size:
+                worker.stop()
+            else:
+                self._idle.put(worker)
+
+    def _acquire_worker(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._start_worker()
+            if worker.is_alive():
+                return worker
+            worker.stop()
+
+    def _release_worker(self, worker):
+        if self._closed or worker.runs >= self.max_runs or not worker.is_alive():
+            worker.stop()
+            if self.prestart and not self._closed:
+                self._start_in_background(1)
+        else:
+            self._put_idle(worker)
+
+    def _round_trip(self, request):
+        """The worker's reply, or None when it did not answer in time."""
+        started = time.monotonic()
+        with self._slots, metrics.POOL_BUSY.track():
+            metrics.QUEUE_WAIT_SECONDS.observe(time.monotonic() - started)
+            worker = self._acquire_worker()
+            run_started = time.monotonic()
+            try:
+                data = worker.run(request)
+            except WorkerTimeout:
+                worker.stop()
+                return None
+            except BaseException:
+                worker.stop()
+                raise
+            # Whatever the round trip took beyond the run itself: fork, IPC, reaping
+            metrics.SPAWN_SECONDS.observe(max(time.monotonic() - run_started - data['duration'], 0), kind='fork')
+            self._release_worker(worker)
+        return data
+
+    def run(self, code, timeout, expected_output=None):
+        started = time.monotonic()
+        return pool_result(self._round_trip(make_request(code, timeout, expected_output=expected_output)), started)
+
+    def run_cases(self, code, cases, fail_fast, timeout):
+        """Run code against every case in one worker; returns a result per case run."""
+        started = time.monotonic()
+        return pool_case_results(self._round_trip(make_request(code, timeout, cases, fail_fast)), started)
+
+    def close(self):
+        with self._lock:
+            if not self._closed:
+                metrics.POOL_SIZE.dec(self.size)
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's worker pool, creating it after a fork if needed."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = WorkerPool(
+                get_setting('POOL_SIZE'), get_setting('MAX_RUNS_PER_WORKER'), prestart=get_setting('PRESTART')
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def warm_pool(**kwargs):
+    """
+    request_started receiver: create the pool, which starts its workers
+    in the background, when a process serves its first request.
+    """
+    if hasattr(os, 'fork') and get_setting('PRESTART') and _pool_pid != os.getpid():
+        get_pool()
+
+
+@atexit.register
+def _close_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
+
+
+def _read_bounded(stream, chunks, budget, on_exceeded):
+    while True:
+        chunk = stream.read(65536)
+        if not chunk:
+            return
+        with budget['lock']:
+            room = budget['left']
+            if room is not None:
+                budget['left'] = max(room - len(chunk), 0)
+        if room is None:
+            # MAX_OUTPUT of None: no cap
+            chunks.append(chunk)
+            continue
+        chunks.append(chunk[:room])
+        if len(chunk) > room:
+            on_exceeded()
+            return
+
+
+def run_in_subprocess(code, timeout, stdin=None):
+    """
+    Run code in a fresh interpreter. Used where os.fork (and with it the
+    rlimits) is unavailable; output is still capped.
+    """
+    started = time.monotonic()
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
+        f.write(code)
+        temp_file = f.name
+    try:
+        # A file rather than a pipe, so a program that never reads it cannot block the write
+        with tempfile.TemporaryFile() as stdin_file:
+            if stdin is not None:
+                stdin_file.write(stdin.encode('utf-8'))
+                stdin_file.seek(0)
+            proc = subprocess.Popen(
+                [sys.executable, temp_file],
+                stdin=stdin_file if stdin is not None else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        budget = {'left': get_setting('MAX_OUTPUT'), 'lock': threading.Lock()}
+        exceeded = threading.Event()
+
+        def on_exceeded():
+            exceeded.set()
+            proc.kill()
+
+        stdout, stderr = [], []
+        readers = [
+            threading.Thread(target=_read_bounded, args=(proc.stdout, stdout, budget, on_exceeded)),
+            threading.Thread(target=_read_bounded, args=(proc.stderr, stderr, budget, on_exceeded)),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            return ExecutionResult.timeout(time.monotonic() - started)
+        finally:
+            for reader in readers:
+                reader.join()
+    finally:
+        os.unlink(temp_file)
+    return ExecutionResult(
+        b''.join(stdout).decode('utf-8', errors='replace'),
+        b''.join(stderr).decode('utf-8', errors='replace'),
+        proc.returncode,
+        duration=time.monotonic() - started,
+        limit='output' if exceeded.is_set() else None,
+    )
+
+
+def run_cases_in_subprocess(code, cases, fail_fast, timeout):
+    """execute_cases without os.fork: a fresh interpreter per case."""
+    deadline = time.monotonic() + timeout
+    results = []
+    for case in cases:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            result = ExecutionResult.timeout(0.0)
+        else:
+            result = run_in_subprocess(code, remaining, case['stdin'])
+        result.passed = case_passed(result, case['expected_output'])
+        results.append(result)
+        if fail_fast and not result.passed:
+            break
+    return results
+
+
+def case_passed(result, expected_output):
+    return (
+        result.returncode == 0
+        and result.limit is None
+        and tuple(result.stdout.split()) == expected_tokens(expected_output)
+    )
+
+
+def execute(code, timeout=None, pool=None, expected_output=None, checked=False):
+    """
+    Run a Python submission and return an ExecutionResult. `pool`
+    overrides the process-wide worker pool, e.g. for batch jobs that want
+    more workers. With `expected_output` a pool run is graded as it goes:
+    `passed` is set and stdout holds at most OUTPUT_PREVIEW bytes. Other
+    backends leave `passed` as None. Code failing api.validation is
+    rejected without running, unless `checked` says the caller validated
+    it.
+    """
+    rejected, timeout = prepare(code, timeout, checked=checked)
+    if rejected is not None:
+        return rejected
+    with timed('executor'), metrics.EXECUTIONS_IN_FLIGHT.track():
+        if hasattr(os, 'fork'):
+            result, backend = (pool or get_pool()).run(code, timeout, expected_output), 'pool'
+        else:
+            result, backend = run_in_subprocess(code, timeout), 'subprocess'
+    record_metrics([result], backend)
+    return result
+
+
+def record_metrics(results, backend):
+    for result in results:
+        if result.diverged:
+            outcome = 'diverged'
+        else:
+            outcome = result.limit or ('ok' if result.returncode == 0 else 'error')
+        metrics.EXECUTIONS.inc(backend=backend, outcome=outcome)
+        metrics.RUN_SECONDS.observe(result.duration, backend=backend)
+        metrics.OUTPUT_BYTES.observe(len(result.stdout) + len(result.stderr))
+
+
+def execute_cases(code, cases, fail_fast=True, timeout=None, pool=None, checked=False):
+    """
+    Run a submission against test cases, each a dict with 'stdin' and
+    'expected_output', sharing one timeout. Returns an ExecutionResult
+    with `passed` set per case run; with fail_fast the list ends at the
+    first failing case.
+    """
+    rejected, timeout = prepare(code, timeout, cases=True, checked=checked)
+    if rejected is not None:
+        return rejected
+    with timed('executor'), metrics.EXECUTIONS_IN_FLIGHT.track():
+        if hasattr(os, 'fork'):
+            results, backend = (pool or get_pool()).run_cases(code, cases, fail_fast, timeout), 'pool'
+        else:
+            results, backend = run_cases_in_subprocess(code, cases, fail_fast, timeout), 'subprocess'
+    record_metrics(results, backend)
+    return results
@@ -0,0 +1,379 @@
+"""
+Warm interpreter worker used by api.runner.
+
+This file is started as a standalone script and must only import the
+standard library. It reads length-prefixed JSON requests on stdin, runs
+each submission in a forked child with a fresh namespace and writes the
+captured stdout, stderr and exit status back on stdout. The child runs
+under the requested rlimits and its output is read through a bounded
+reader that stops the run once the byte cap is reached.
+
+A request with test cases runs the code once per case, each in its own
+child with the case's stdin, against one deadline for all of them, and
+compares the output here so fail-fast can skip the remaining cases.
+
+Requests that carry the expected output, as whitespace-separated tokens,
+have stdout compared while the child writes it. The child is killed as
+soon as the output diverges or runs past the expected tokens, and only
+the first `preview` bytes of stdout are kept for display.
+
+Children are not forked from this process, which holds the whole
+request: a submission could walk its frames or the heap and read the
+expected output and the other cases' stdin. They are forked by a
+zygote, a process forked at start-up before any request is read. It is
+sent only the code, the limits and one case's stdin, with the output
+pipes passed over a Unix socket, and it reports the child's pid and
+exit status back.
+"""
+import codecs
+import errno
+import io
+import json
+import linecache
+import os
+import resource
+import selectors
+import signal
+import socket
+import struct
+import sys
+import time
+import traceback
+
+HEADER = struct.Struct('>I')
+FILENAME = 'main.py'
+
+
+def read_exactly(fd, size):
+    data = b''
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv(fd):
+    header = read_exactly(fd, HEADER.size)
+    if header is None:
+        return None
+    body = read_exactly(fd, HEADER.unpack(header)[0])
+    if body is None:
+        return None
+    return json.loads(body.decode('utf-8'))
+
+
+def send(fd, message):
+    body = json.dumps(message).encode('utf-8')
+    os.write(fd, HEADER.pack(len(body)) + body)
+
+
+def exec_submission(code):
+    """Run code as __main__ and return the process exit status."""
+    linecache.cache[FILENAME] = (len(code), None, code.splitlines(True), FILENAME)
+    try:
+        compiled = compile(code, FILENAME, 'exec')
+        exec(compiled, {'__name__': '__main__', '__builtins__': __builtins__})
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        tb = e.__traceback__
+        # Hide this module's frame so tracebacks look like `python main.py`
+        if tb is not None and tb.tb_frame.f_code is exec_submission.__code__:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb)
+        return 1
+    return 0
+
+
+def apply_limits(limits):
+    """Apply rlimits to the current process. Values of None are left alone."""
+    for name, rlimit in (
+        ('cpu', resource.RLIMIT_CPU),
+        ('memory', resource.RLIMIT_AS),
+        ('nproc', resource.RLIMIT_NPROC),
+        ('fsize', resource.RLIMIT_FSIZE),
+    ):
+        value = limits.get(name)
+        if value is None:
+            continue
+        hard = resource.getrlimit(rlimit)[1]
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(rlimit, (value, value))
+
+
+class OutputMatcher:
+    """
+    Compares output with the expected tokens as it arrives. Equal token
+    lists is what api.runner.normalize_output equality means, so no text
+    is kept beyond a token split across two chunks.
+    """
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.index = 0
+        self.partial = ''
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.diverged = False
+
+    def feed(self, chunk, final=False):
+        """Consume a chunk of output; False once it can no longer match."""
+        if self.diverged:
+            return False
+        text = self.partial + self.decoder.decode(chunk, final)
+        tokens = text.split()
+        # A token running to the end of the chunk may continue in the next one
+        self.partial = tokens.pop() if tokens and not final and not text[-1].isspace() else ''
+        for token in tokens:
+            if self.index >= len(self.expected) or token != self.expected[self.index]:
+                self.diverged = True
+                return False
+            self.index += 1
+        if self.partial and (
+            self.index >= len(self.expected) or not self.expected[self.index].startswith(self.partial)
+        ):
+            self.diverged = True
+            return False
+        return True
+
+    def finish(self):
+        """True if the output seen matches the expected tokens exactly."""
+        return self.feed(b'', final=True) and self.index == len(self.expected)
+
+
+def child_main(code, limits, out_w, err_w, stdin=None):
+    os.setsid()
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    apply_limits(limits)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(out_w, 1)
+    os.dup2(err_w, 2)
+    # Including the zygote's socket
+    os.closerange(3, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    if stdin is not None:
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin.encode('utf-8')), encoding='utf-8')
+    status = exec_submission(code)
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(status & 0xFF)
+
+
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def zygote_main(sock):
+    """Fork a child for each job received on `sock` and report its exit."""
+    devnull = os.open(os.devnull, os.O_RDWR)
+    # The worker's request and reply pipes
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    fd = sock.fileno()
+    while True:
+        data, fds, _, _ = socket.recv_fds(sock, HEADER.size, 2)
+        if not data:
+            return
+        header = data + read_exactly(fd, HEADER.size - len(data))
+        job = json.loads(read_exactly(fd, HEADER.unpack(header)[0]).decode('utf-8'))
+        out_w, err_w = fds
+        pid = os.fork()
+        if pid == 0:
+            child_main(job['code'], job['limits'], out_w, err_w, job['stdin'])
+        os.close(out_w)
+        os.close(err_w)
+        send(fd, {'pid': pid})
+        send(fd, {'status': os.waitpid(pid, 0)[1]})
+
+
+class Zygote:
+    def __init__(self):
+        self.sock, zygote_sock = socket.socketpair()
+        self.pid = os.fork()
+        if self.pid == 0:
+            self.sock.close()
+            try:
+                zygote_main(zygote_sock)
+            finally:
+                os._exit(0)
+        zygote_sock.close()
+
+    def spawn(self, code, limits, stdin, out_w, err_w):
+        """Start a child writing to out_w and err_w; returns its pid."""
+        body = json.dumps({'code': code, 'limits': limits, 'stdin': stdin}).encode('utf-8')
+        socket.send_fds(self.sock, [HEADER.pack(len(body))], [out_w, err_w])
+        self.sock.sendall(body)
+        return self._recv()['pid']
+
+    def wait(self, pid, deadline):
+        """
+        Wait for the child's exit, killing its process group once the
+        deadline passes. A child can close its output pipes and keep
+        running, so EOF on them does not mean it has exited. Returns
+        (wait status, whether the deadline killed it).
+        """
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.sock, selectors.EVENT_READ)
+            remaining = deadline - time.monotonic()
+            killed = remaining <= 0 or not selector.select(remaining)
+        if killed:
+            kill_group(pid)
+        return self._recv()['status'], killed
+
+    def _recv(self):
+        message = recv(self.sock.fileno())
+        if message is None:
+            raise RuntimeError('zygote exited')
+        return message
+
+
+def detect_limit(returncode, stderr, limits):
+    """Name the rlimit that ended the run, if one did."""
+    if returncode == -signal.SIGXCPU or (returncode == -signal.SIGKILL and limits.get('cpu')):
+        return 'cpu'
+    # Python ignores SIGXFSZ, so the write fails with EFBIG instead
+    if returncode == -signal.SIGXFSZ or f'[Errno {errno.EFBIG}]' in stderr:
+        return 'fsize'
+    if stderr.rstrip().endswith('MemoryError'):
+        return 'memory'
+    return None
+
+
+def run_child(zygote, code, deadline, limits, max_output, stdin=None, expected=None, preview=None):
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    started = time.monotonic()
+    pid = zygote.spawn(code, limits, stdin, out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+
+    buffers = {out_r: [], err_r: []}
+    matcher = OutputMatcher(expected) if expected is not None else None
+    kept = 0
+    timed_out = False
+    output_exceeded = False
+    output_size = 0
+    with selectors.DefaultSelector() as selector:
+        selector.register(out_r, selectors.EVENT_READ)
+        selector.register(err_r, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                kill_group(pid)
+                break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, 65536)
+                if not chunk:
+                    selector.unregister(key.fd)
+                    continue
+                if max_output is not None and output_size + len(chunk) > max_output:
+                    # Keep what fits and stop the run instead of buffering more
+                    chunk = chunk[:max_output - output_size]
+                    output_exceeded = True
+                output_size += len(chunk)
+                if key.fd == out_r and matcher is not None:
+                    if preview is None or kept < preview:
+                        buffers[out_r].append(chunk if preview is None else chunk[:preview - kept])
+                        kept += len(buffers[out_r][-1])
+                    if not matcher.feed(chunk):
+                        break
+                else:
+                    buffers[key.fd].append(chunk)
+            if output_exceeded or (matcher is not None and matcher.diverged):
+                kill_group(pid)
+                break
+    os.close(out_r)
+    os.close(err_r)
+
+    wait_status, killed = zygote.wait(pid, deadline)
+    timed_out = timed_out or killed
+    returncode = os.waitstatus_to_exitcode(wait_status)
+    # Reap anything the submission left running in its session
+    kill_group(pid)
+
+    stdout = b''.join(buffers[out_r]).decode('utf-8', errors='replace')
+    stderr = b''.join(buffers[err_r]).decode('utf-8', errors='replace')
+    diverged = matcher is not None and matcher.diverged
+    if timed_out:
+        limit = 'timeout'
+    elif output_exceeded:
+        limit = 'output'
+    elif diverged:
+        # Killed by us, not by a limit
+        limit = None
+    else:
+        limit = detect_limit(returncode, stderr, limits)
+
+    result = {
+        'stdout': stdout,
+        'stderr': stderr,
+        'returncode': returncode,
+        'timed_out': timed_out,
+        'limit': limit,
+        'duration': time.monotonic() - started,
+    }
+    if matcher is not None:
+        result['diverged'] = diverged
+        result['passed'] = returncode == 0 and limit is None and not diverged and matcher.finish()
+    return result
+
+
+def run(zygote, request):
+    return run_child(
+        zygote,
+        request['code'],
+        time.monotonic() + request['timeout'],
+        request.get('limits', {}),
+        request.get('max_output'),
+        expected=request.get('expected'),
+        preview=request.get('preview'),
+    )
+
+
+def run_cases(zygote, request):
+    started = time.monotonic()
+    deadline = started + request['timeout']
+    results = []
+    for case in request['cases']:
+        if time.monotonic() >= deadline:
+            # Out of time before this case started: no need to fork for it
+            result = {'stdout': '', 'stderr': '', 'returncode': -9, 'timed_out': True,
+                      'limit': 'timeout', 'duration': 0.0, 'passed': False}
+        else:
+            result = run_child(zygote, request['code'], deadline, request.get('limits', {}),
+                               request.get('max_output'), case['stdin'], case['expected'],
+                               request.get('preview'))
+        results.append(result)
+        if request.get('fail_fast') and not result['passed']:
+            break
+    return {'cases': results, 'duration': time.monotonic() - started}
+
+
+def main():
+    in_fd = sys.stdin.fileno()
+    out_fd = sys.stdout.fileno()
+    zygote = Zygote()
+    # Tells the parent the interpreter has started and is ready for work
+    send(out_fd, {'ready': True})
+    while True:
+        request = recv(in_fd)
+        if request is None:
+            break
+        send(out_fd, run_cases(zygote, request) if 'cases' in request else run(zygote, request))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,66 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Topic, Question, UserProgress, TopicProgress
+from django.urls import reverse
+from django.utils.http import urlencode
+from .curriculum import get_curriculum
+from .models import Topic, Question, Submission
+from .progress import get_topic_progress, get_question_progress
+
+
+def parse_field_selection(value):
+    """
+    Parse ?fields=id,title,questions.title into
+    {'id': None, 'title': None, 'questions': {'title': None}}, where None
+    selects the whole field.
+    """
+    selection = {}
+    for path in value.split(','):
+        names = [name.strip() for name in path.split('.')]
+        if not all(names):
+            continue
+        node = selection
+        for name in names[:-1]:
+            if name in node and node[name] is None:
+                break
+            node = node.setdefault(name, {})
+        else:
+            node[names[-1]] = None
+    return selection
+
+
+class FieldSelectionMixin:
+    """
+    Serializes only the fields named in the request's ?fields= parameter,
+    so unselected method fields are never computed. Without a selection,
+    the fields in `default_exclude` are left out; they can still be asked
+    for by name.
+    """
+    default_exclude = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self._field_selection()
+        if selection is None:
+            for name in self.default_exclude:
+                fields.pop(name, None)
+            return fields
+        for name in list(fields):
+            if name not in selection:
+                del fields[name]
+            elif selection[name] is not None:
+                nested = fields[name]
+                getattr(nested, 'child', nested).selected_fields = selection[name]
+        return fields
+
+    def _field_selection(self):
+        if hasattr(self, 'selected_fields'):
+            return self.selected_fields
+        # Only the top-level serializer reads the query string
+        if self.root not in (self, self.parent):
+            return None
+        request = self.context.get('request')
+        value = request.query_params.get('fields') if request is not None else None
+        return parse_field_selection(value) if value else None
 
 
 class UserRegisterSerializer(serializers.ModelSerializer):
@@ -32,7 +92,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email')
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     is_completed = serializers.SerializerMethodField()
     submitted_code = serializers.SerializerMethodField()
     attempts = serializers.SerializerMethodField()
@@ -41,35 +101,21 @@ class QuestionSerializer(serializers.ModelSerializer):
         model = Question
         fields = ('id', 'title', 'description', 'order', 'is_completed', 'submitted_code', 'attempts', 'hint')
 
+    # Topic pages only list questions; the code is loaded with the question
+    default_exclude = ('submitted_code',)
+
     def get_is_completed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return UserProgress.objects.filter(
-                user=request.user,
-                question=obj,
-                completed=True
-            ).exists()
-        return False
+        return self._progress(obj)['completed']
 
     def get_submitted_code(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            progress = UserProgress.objects.filter(
-                user=request.user,
-                question=obj
-            ).first()
-            return progress.submitted_code if progress else ''
-        return ''
+        return self._progress(obj)['submitted_code']
 
     def get_attempts(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            progress = UserProgress.objects.filter(
-                user=request.user,
-                question=obj
-            ).first()
-            return progress.attempts if progress else 0
-        return 0
+        return self._progress(obj)['attempts']
+
+    def _progress(self, obj):
+        # Only read the code column when the response includes it
+        return get_question_progress(self.context, obj, with_code='submitted_code' in self.fields)
 
 
 class QuestionDetailSerializer(serializers.ModelSerializer):
@@ -85,34 +131,13 @@ class QuestionDetailSerializer(serializers.ModelSerializer):
                   'attempts', 'hint', 'required_keywords')
 
     def get_is_completed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return UserProgress.objects.filter(
-                user=request.user,
-                question=obj,
-                completed=True
-            ).exists()
-        return False
+        return get_question_progress(self.context, obj)['completed']
 
     def get_submitted_code(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            progress = UserProgress.objects.filter(
-                user=request.user,
-                question=obj
-            ).first()
-            return progress.submitted_code if progress else ''
-        return ''
+        return get_question_progress(self.context, obj)['submitted_code']
 
     def get_attempts(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            progress = UserProgress.objects.filter(
-                user=request.user,
-                question=obj
-            ).first()
-            return progress.attempts if progress else 0
-        return 0
+        return get_question_progress(self.context, obj)['attempts']
 
 
 class TopicSerializer(serializers.ModelSerializer):
@@ -126,84 +151,46 @@ class TopicSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'description', 'order', 'is_unlocked', 'is_completed', 'questions_count', 'completed_count')
 
     def get_is_unlocked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            first_topic = Topic.objects.order_by('order').first()
-            if first_topic and obj.id == first_topic.id:
-                return True
-            
-            progress = TopicProgress.objects.filter(
-                user=request.user,
-                topic=obj,
-                is_unlocked=True
-            ).exists()
-            return progress
-        
-        first_topic = Topic.objects.order_by('order').first()
-        return obj.id == first_topic.id if first_topic else False
+        return get_topic_progress(self.context, obj)['is_unlocked']
 
     def get_is_completed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            total = obj.questions.count()
-            if total == 0:
-                return False
-            completed = UserProgress.objects.filter(
-                user=request.user,
-                question__topic=obj,
-                completed=True
-            ).count()
-            return completed >= total
-        return False
+        return get_topic_progress(self.context, obj)['is_completed']
 
     def get_questions_count(self, obj):
-        return obj.questions.count()
+        return get_topic_progress(self.context, obj)['questions_count']
 
     def get_completed_count(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return UserProgress.objects.filter(
-                user=request.user,
-                question__topic=obj,
-                completed=True
-            ).count()
-        return 0
+        return get_topic_progress(self.context, obj)['completed_count']
 
 
-class TopicDetailSerializer(serializers.ModelSerializer):
+class TopicDetailSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, read_only=True)
     is_unlocked = serializers.SerializerMethodField()
     is_completed = serializers.SerializerMethodField()
+    theory_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Topic
-        fields = ('id', 'title', 'description', 'theory', 'order', 'questions', 'is_unlocked', 'is_completed')
+        fields = ('id', 'title', 'description', 'theory', 'theory_url', 'order', 'questions', 'is_unlocked', 'is_completed')
+
+    # Theory is loaded separately from theory_url, which browsers and proxies cache
+    default_exclude = ('theory',)
+
+    def get_theory_url(self, obj):
+        # Relative, resolved against the API's origin by the client: behind
+        # a TLS-terminating proxy an absolute URL would be built as http
+        curriculum = get_curriculum()
+        query = urlencode({'v': curriculum.version, 'sig': curriculum.theory_signature(obj.id)})
+        return f"{reverse('topic_theory', args=[obj.id])}?{query}"
 
     def get_is_unlocked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            first_topic = Topic.objects.order_by('order').first()
-            if first_topic and obj.id == first_topic.id:
-                return True
-            
-            progress = TopicProgress.objects.filter(
-                user=request.user,
-                topic=obj,
-                is_unlocked=True
-            ).exists()
-            return progress
-        return False
+        return get_topic_progress(self.context, obj)['is_unlocked']
 
     def get_is_completed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            total = obj.questions.count()
-            if total == 0:
-                return False
-            completed = UserProgress.objects.filter(
-                user=request.user,
-                question__topic=obj,
-                completed=True
-            ).count()
-            return completed >= total
-        return False
\ No newline at end of file
+        return get_topic_progress(self.context, obj)['is_completed']
+
+
+class SubmissionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Submission
+        fields = ('id', 'question', 'code', 'verdict', 'runtime', 'output_size', 'created_at')
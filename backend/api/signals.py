@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+
+from .curriculum import invalidate_curriculum
+from .models import Topic, Question, UserProgress, TopicProgress
+from .progress import bump_progress_version, recompute_topic_progress
+
+for model in (Topic, Question):
+    post_save.connect(invalidate_curriculum, sender=model, dispatch_uid=f'curriculum_save_{model.__name__}')
+    post_delete.connect(invalidate_curriculum, sender=model, dispatch_uid=f'curriculum_delete_{model.__name__}')
+
+
+def remember_completed_users(sender, instance, **kwargs):
+    # The progress rows are gone by post_delete, so collect the users first
+    instance._completed_user_ids = list(
+        UserProgress.objects.filter(question=instance, completed=True).values_list('user_id', flat=True)
+    )
+
+
+def remember_moved_question(sender, instance, raw=False, **kwargs):
+    # A question moved to another topic counts towards the new topic from now on
+    if raw or instance.pk is None:
+        return
+    old_topic_id = Question.objects.filter(pk=instance.pk).values_list('topic_id', flat=True).first()
+    if old_topic_id is not None and old_topic_id != instance.topic_id:
+        remember_completed_users(sender, instance)
+
+
+def recompute_completed_users(sender, instance, **kwargs):
+    """
+    Keep completed_count right for users who had completed a deleted
+    question, or one moved to another topic.
+    """
+    user_ids = getattr(instance, '_completed_user_ids', None)
+    if user_ids:
+        instance._completed_user_ids = None
+        # Registered after invalidate_curriculum, so it runs on the new snapshot
+        transaction.on_commit(lambda: recompute_topic_progress(user_ids))
+
+
+pre_delete.connect(remember_completed_users, sender=Question, dispatch_uid='progress_pre_delete_Question')
+post_delete.connect(recompute_completed_users, sender=Question, dispatch_uid='progress_delete_Question')
+pre_save.connect(remember_moved_question, sender=Question, dispatch_uid='progress_pre_save_Question')
+post_save.connect(recompute_completed_users, sender=Question, dispatch_uid='progress_save_Question')
+
+
+def progress_changed(sender, instance, **kwargs):
+    # Writes through update()/bulk_create bump the version themselves
+    bump_progress_version(instance.user_id)
+
+
+for model in (UserProgress, TopicProgress):
+    post_save.connect(progress_changed, sender=model, dispatch_uid=f'progress_save_{model.__name__}')
+    post_delete.connect(progress_changed, sender=model, dispatch_uid=f'progress_delete_{model.__name__}')
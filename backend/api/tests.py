@@ -0,0 +1,870 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+import asyncio
+import gzip
+import io
+import os
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock, skipIf
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, connections
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import Throttled
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import compression
+from .admission import enter, leave, take_token
+from .async_runner import AsyncWorkerPool, get_async_pool
+from .grading import check_submission, record_attempt, record_pass
+from .jobs import claim_jobs, finish_job, requeue_stale_jobs, run_job
+from .keyword_rules import missing_keywords
+from .models import ExecutionJob, Topic, Question, Submission, TopicProgress, UserProgress
+from .regrade import regrade_questions
+from .renderers import ORJSONParser, ORJSONRenderer
+from . import result_cache
+from .result_cache import execute_cached, execute_cases_cached, is_cacheable
+from .runner import WorkerPool, execute, execute_cases, run_in_subprocess
+from .runner_worker import OutputMatcher
+
+# A private cache per test run, and no worker processes started by requests
+TEST_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'CODE_RUNNER': {'PRESTART': False},
+}
+
+
+def make_topics(count, questions_per_topic=3):
+    topics = []
+    for index in range(count):
+        topic = Topic.objects.create(title=f'Topic {index}', theory='Theory', order=index)
+        for number in range(questions_per_topic):
+            Question.objects.create(
+                topic=topic, title=f'Question {number}', description='Print it', expected_output='1', order=number
+            )
+        topics.append(topic)
+    return topics
+
+
+@override_settings(**TEST_SETTINGS)
+class ProgressQueryCountTests(TestCase):
+    """dashboard/ and topics/ must not issue queries per topic."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_constant_queries(self, url):
+        for topic_count in (2, 6):
+            with self.subTest(topics=topic_count):
+                # Curriculum invalidation runs on commit
+                with self.captureOnCommitCallbacks(execute=True):
+                    Topic.objects.all().delete()
+                    make_topics(topic_count)
+                # The first request builds the curriculum snapshot and the user's first TopicProgress row
+                self.client.get(url)
+                with self.assertNumQueries(2):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['topics'] if 'topics' in response.data else response.data), topic_count)
+
+    def test_dashboard(self):
+        self.assert_constant_queries('/api/dashboard/')
+
+    def test_topics(self):
+        self.assert_constant_queries('/api/topics/')
+
+
+@override_settings(**TEST_SETTINGS)
+class TopicDetailQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic = make_topics(1)[0]
+        question = self.topic.questions.first()
+        UserProgress.objects.create(user=self.user, question=question, submitted_code='print(1)', attempts=1)
+
+    def progress_sql(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in queries if 'api_userprogress' in q['sql']]
+
+    def test_code_not_read_by_default(self):
+        response, sql = self.progress_sql(f'/api/topics/{self.topic.id}/')
+        self.assertTrue(sql)
+        self.assertFalse(any('submitted_code' in statement for statement in sql))
+        self.assertNotIn('submitted_code', response.data['questions'][0])
+
+    def test_code_read_when_selected(self):
+        response, sql = self.progress_sql(f'/api/topics/{self.topic.id}/?fields=questions.submitted_code')
+        self.assertTrue(any('submitted_code' in statement for statement in sql))
+        self.assertEqual(response.data['questions'][0]['submitted_code'], 'print(1)')
+
+
+@override_settings(**TEST_SETTINGS)
+class TopicFieldsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('learner'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic = make_topics(1)[0]
+        self.url = f'/api/topics/{self.topic.id}/'
+
+    def test_theory_comes_from_theory_url(self):
+        data = self.client.get(self.url).data
+        self.assertNotIn('theory', data)
+        self.assertTrue(data['theory_url'].startswith(f'/api/topics/{self.topic.id}/theory/?'))
+        # Signed and public, so it needs no token
+        response = APIClient().get(data['theory_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['theory'], 'Theory')
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_fields_selection(self):
+        self.assertEqual(set(self.client.get(self.url, {'fields': 'id,title'}).data), {'id', 'title'})
+        self.assertEqual(self.client.get(self.url, {'fields': 'theory'}).data, {'theory': 'Theory'})
+        data = self.client.get(self.url, {'fields': 'id,questions.title'}).data
+        self.assertEqual(set(data), {'id', 'questions'})
+        self.assertEqual(data['questions'][0], {'title': 'Question 0'})
+
+
+class CacheabilityTests(SimpleTestCase):
+    def test_deterministic_code_is_cached(self):
+        self.assertTrue(is_cacheable('import math\nprint(math.pi)'))
+        self.assertTrue(is_cacheable('# import random\nprint("import random")'))
+
+    def test_nondeterministic_imports_are_not_cached(self):
+        for code in (
+            'import random',
+            'import math, random',
+            'x = 1; import random',
+            'from datetime import datetime',
+            'import os.path',
+            'if True:\n    import time',
+            "random = __import__('random')",
+            "import importlib\nimportlib.import_module('random')",
+        ):
+            with self.subTest(code=code):
+                self.assertFalse(is_cacheable(code))
+
+
+@override_settings(**TEST_SETTINGS)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.topic = make_topics(1)[0]
+        self.question = self.topic.questions.first()
+        self.urls = [f'/api/topics/{self.topic.id}/', f'/api/questions/{self.question.id}/']
+
+    def etags(self):
+        return [self.client.get(url)['ETag'] for url in self.urls]
+
+    def test_matching_etag_is_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='W/"stale"').status_code, 200)
+
+    def test_field_selection_has_its_own_etag(self):
+        url = self.urls[0]
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url, {'fields': 'id,title'})['ETag'])
+
+    def test_etag_changes_after_a_pass(self):
+        before = self.etags()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/submit/{self.question.id}/', {'code': 'print(1)'}, format='json')
+        self.assertTrue(response.data['passed'])
+        for old, new in zip(before, self.etags()):
+            self.assertNotEqual(old, new)
+
+    def test_etag_changes_after_a_curriculum_edit(self):
+        before = self.etags()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.description = 'Print one'
+            self.question.save()
+        for old, new in zip(before, self.etags()):
+            self.assertNotEqual(old, new)
+
+
+@override_settings(**TEST_SETTINGS)
+class CompressionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('learner'))
+        with self.captureOnCommitCallbacks(execute=True):
+            make_topics(20)
+
+    def get(self, url, encoding):
+        return self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+
+    def test_gzip(self):
+        plain = self.get('/api/topics/', '')
+        self.assertNotIn('Content-Encoding', plain)
+        response = self.get('/api/topics/', 'gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        for result in (plain, response):
+            self.assertIn('Accept-Encoding', result['Vary'])
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.get(f'/api/questions/{Question.objects.first().id}/', 'gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertLess(len(response.content), compression.DEFAULTS['MIN_SIZE'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        plain = self.get('/api/topics/', '')
+        response = self.get('/api/topics/', 'gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(compression.brotli.decompress(response.content), plain.content)
+
+    def test_negotiation(self):
+        available = ('br', 'gzip')
+        self.assertEqual(compression.choose_encoding('gzip, br', available), 'br')
+        self.assertEqual(compression.choose_encoding('br;q=0.5, gzip', available), 'gzip')
+        self.assertEqual(compression.choose_encoding('br;q=0, *', available), 'gzip')
+        self.assertIsNone(compression.choose_encoding('identity', available))
+        self.assertIsNone(compression.choose_encoding('', available))
+
+
+class ORJSONTests(SimpleTestCase):
+    data = {
+        'text': 'caf\u00e9 \u2028 \U0001f40d "quoted"',
+        'numbers': [0, -1, 2.5, 10 ** 18, Decimal('1.10')],
+        'when': timezone.now(),
+        'id': uuid.uuid4(),
+        'nested': {1: None, 'flags': [True, False]},
+    }
+
+    def test_renders_the_same_bytes_as_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_parses_the_same_values_as_drf(self):
+        body = JSONRenderer().render(self.data)
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+
+@override_settings(**TEST_SETTINGS)
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        result_cache.get_cache().clear()
+        self.question = make_topics(1, questions_per_topic=1)[0].questions.get()
+        patcher = mock.patch.object(result_cache, 'execute', wraps=execute)
+        self.execute = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_skips_execution(self):
+        first = execute_cached('print(1)', self.question)
+        # Line endings and trailing blank space do not change the key
+        second = execute_cached('print(1)\r\n\n', self.question)
+        self.assertEqual(self.execute.call_count, 1)
+        self.assertEqual(first[0].stdout, second[0].stdout)
+        self.assertEqual(second[0].stdout, '1\n')
+
+    def test_nondeterministic_code_always_runs(self):
+        for code in ('import random\nprint(random.random())', 'import time\nprint(time.time())'):
+            with self.subTest(code=code):
+                self.execute.reset_mock()
+                outputs = {execute_cached(code, self.question)[0].stdout for _ in range(2)}
+                self.assertEqual(self.execute.call_count, 2)
+                self.assertEqual(len(outputs), 2)
+
+    def test_input_is_part_of_the_key(self):
+        code = 'print(int(input()) * 2)'
+        hits = result_cache.get_cache().stats()['hits']
+        for stdin, doubled in (('2', '4'), ('3', '6')):
+            results = execute_cases_cached(code, self.question, [{'stdin': stdin, 'expected_output': doubled}])
+            self.assertEqual(results[0].stdout, doubled + '\n')
+        self.assertEqual(result_cache.get_cache().stats()['hits'], hits)
+
+
+class KeywordRuleTests(SimpleTestCase):
+    def test_keywords_in_comments_and_strings_do_not_count(self):
+        code = (
+            '# for each item, while True: def helper()\n'
+            'words = "for while def print()"\n'
+            "doc = '''import math; if x else y'''\n"
+            'words += f"{len(doc)} for"\n'
+        )
+        self.assertEqual(
+            missing_keywords(code, 'for, while, def, import, if, else, print(), math'),
+            ['for', 'while', 'def', 'import', 'if', 'else', 'print()', 'math']
+        )
+        self.assertEqual(missing_keywords(code, 'len(), words'), [])
+
+    def test_keywords_in_code_count(self):
+        code = (
+            'import math\n'
+            'def helper(items):\n'
+            '    # nothing here counts\n'
+            '    for item in items:\n'
+            '        while item:\n'
+            '            item -= 1\n'
+            '    return math.pi if items else None\n'
+            'print(helper([1]))\n'
+        )
+        self.assertEqual(
+            missing_keywords(code, 'For, while, def, import, if, else, print(), math, None, return, in'), []
+        )
+        self.assertEqual(missing_keywords(code, 'class, try, len()'), ['class', 'try', 'len()'])
+
+    def test_code_too_deep_to_parse_is_checked_as_text(self):
+        for code in ("'1'" + '.b' * 30000, '-' * 60000 + '1'):
+            with self.subTest(code=code[:10]):
+                self.assertEqual(missing_keywords(code, 'for, 1, print'), ['for', 'print'])
+
+
+@override_settings(**TEST_SETTINGS)
+class DeeplyNestedSubmissionTests(TestCase):
+    def test_submit_reports_missing_keywords(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            question = make_topics(1, questions_per_topic=1)[0].questions.get()
+        question.required_keywords = 'for'
+        question.save()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('learner'))
+        response = client.post(f'/api/submit/{question.id}/', {'code': "'1'" + '.b' * 30000}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['missing_keywords'], ['for'])
+
+
+@override_settings(CODE_RUNNER={'MAX_OUTPUT': None})
+class SubprocessRunnerTests(SimpleTestCase):
+    def test_output_without_cap(self):
+        result = run_in_subprocess("print('x' * 200000)", 10)
+        self.assertEqual(result.returncode, 0)
+        self.assertIsNone(result.limit)
+        self.assertEqual(len(result.stdout), 200001)
+
+
+class OutputMatcherTests(SimpleTestCase):
+    def match(self, chunks, expected):
+        matcher = OutputMatcher(expected.split())
+        return all(matcher.feed(chunk) for chunk in chunks) and matcher.finish()
+
+    def test_token_split_across_chunks(self):
+        self.assertTrue(self.match([b'12', b'34 5', b'6\n'], '1234 56'))
+        self.assertTrue(self.match([b'caf\xc3', b'\xa9\n'], 'caf\u00e9'))
+        self.assertFalse(self.match([b'12', b'35'], '1234'))
+
+    def test_output_past_the_expected_tokens(self):
+        self.assertFalse(self.match([b'1 2 3'], '1 2'))
+        self.assertFalse(self.match([b'1 2', b'3'], '12'))
+        matcher = OutputMatcher(['1'])
+        self.assertTrue(matcher.feed(b'1\n'))
+        self.assertFalse(matcher.feed(b'2\n'))
+
+    def test_whitespace_differences_match(self):
+        self.assertTrue(self.match([b'1  2 \t\n', b'3   \n\n'], '1 2\n3'))
+        self.assertFalse(self.match([b'1 2'], '1 2 3'))
+
+    def test_early_mismatch_stops_the_child(self):
+        pool = WorkerPool(1, 10)
+        self.addCleanup(pool.close)
+        result = pool.run('while True:\n    print(2)', 10, expected_output='1')
+        self.assertTrue(result.diverged)
+        self.assertFalse(result.passed)
+        self.assertFalse(result.timed_out)
+        self.assertLess(result.duration, 5)
+
+
+class WorkerPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = WorkerPool(1, 10)
+        self.addCleanup(self.pool.close)
+
+    def test_child_closing_its_output_is_killed_at_the_deadline(self):
+        with tempfile.NamedTemporaryFile('r') as pid_file:
+            code = (
+                f"import os, time\nopen({pid_file.name!r}, 'w').write(str(os.getpid()))\n"
+                "os.closerange(0, 1024)\ntime.sleep(30)"
+            )
+            started = time.monotonic()
+            result = self.pool.run(code, 1)
+            pid = int(pid_file.read())
+        self.assertEqual(result.limit, 'timeout')
+        self.assertLess(time.monotonic() - started, 2)
+        # Reaped, not left running in its own session
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+class AsyncWorkerPoolTests(SimpleTestCase):
+    async def test_prestart(self):
+        pool = AsyncWorkerPool(2, 10, prestart=True)
+        try:
+            for _ in range(100):
+                if len(pool._idle) == 2:
+                    break
+                await asyncio.sleep(0.1)
+            self.assertEqual(len(pool._idle), 2)
+            result = await pool.run('print(6 * 7)', 5)
+            self.assertEqual(result.stdout, '42\n')
+        finally:
+            pool.close()
+
+
+@override_settings(**TEST_SETTINGS)
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner')
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def test_not_served_under_wsgi(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('api.async_runner.get_async_pool') as get_async_pool:
+            response = client.post('/api/run-code/async/', {'code': 'print(1)'}, format='json')
+        self.assertEqual(response.status_code, 404)
+        get_async_pool.assert_not_called()
+
+    async def test_run_code_under_asgi(self):
+        response = await AsyncClient().post(
+            '/api/run-code/async/', {'code': 'print(6 * 7)'}, content_type='application/json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'output': '42\n', 'error': None})
+        await get_async_pool().aclose()
+
+
+@override_settings(**TEST_SETTINGS)
+class SandboxTests(SimpleTestCase):
+    def test_submission_cannot_reach_the_web_process(self):
+        code = "import collections\nprint('{0._sys.modules[django.conf].settings.SECRET_KEY}'.format(collections))"
+        result = execute(code)
+        self.assertNotIn(settings.SECRET_KEY, result.stdout + result.stderr)
+        self.assertNotEqual(result.returncode, 0)
+
+    def test_submission_cannot_read_expected_output_or_other_cases(self):
+        # Searches every frame above its own and every container on the heap for
+        # any expected output and for the other case's input
+        code = (
+            "import gc, sys\n"
+            "def find(needles):\n"
+            "    frame = sys._getframe().f_back.f_back\n"
+            "    while frame is not None:\n"
+            "        if any(needle in repr(frame.f_locals) for needle in needles):\n"
+            "            return 'frame'\n"
+            "        frame = frame.f_back\n"
+            "    for obj in gc.get_objects():\n"
+            "        if obj is not needles and obj is not globals() and isinstance(obj, (dict, list, tuple)):\n"
+            "            try:\n"
+            "                if any(needle in repr(obj) for needle in needles):\n"
+            "                    return 'heap'\n"
+            "            except Exception:\n"
+            "                pass\n"
+            "    return 'nothing'\n"
+            "own = sys.stdin.read()\n"
+            "needles = [''.join(['-', 'output'])]\n"
+            "needles += [text for text in (''.join([name, '-input']) for name in ('first', 'second')) if text != own]\n"
+            "print('found', find(needles), file=sys.stderr)\n"
+        )
+        cases = [
+            {'stdin': 'first-input', 'expected_output': 'first-output'},
+            {'stdin': 'second-input', 'expected_output': 'second-output'},
+        ]
+        results = execute_cases(code, cases, fail_fast=False)
+        self.assertEqual([result.stderr for result in results], ['found nothing\n'] * 2)
+        result = execute(code, expected_output='first-output')
+        self.assertEqual(result.stderr, 'found nothing\n')
+
+
+@override_settings(**TEST_SETTINGS)
+class RegradeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question = make_topics(1, questions_per_topic=1)[0].questions.get()
+        self.rows = [
+            UserProgress.objects.create(
+                user=User.objects.create_user(f'learner{index}'), question=self.question, submitted_code='print(1)'
+            )
+            for index in range(5)
+        ]
+
+    def test_failures_are_reported_and_the_rest_saved(self):
+        broken = self.rows[2].id
+
+        def grade(progress, *args):
+            if progress.id == broken:
+                raise RuntimeError('worker died')
+            return True
+
+        with mock.patch('api.regrade._grade', side_effect=grade):
+            report = regrade_questions([self.question], workers=2, chunk_size=2)
+        self.assertEqual(report['failed'], 1)
+        self.assertIn(f'submission {broken}', report['errors'][0])
+        self.assertEqual(report['newly_passed'], 4)
+        completed = dict(UserProgress.objects.values_list('id', 'completed'))
+        self.assertFalse(completed.pop(broken))
+        self.assertTrue(all(completed.values()))
+
+    def test_chunks_are_saved_as_they_finish(self):
+        saved = []
+
+        def on_progress(done, total):
+            saved.append(UserProgress.objects.filter(completed=True).count())
+
+        with mock.patch('api.regrade._grade', return_value=True):
+            regrade_questions([self.question], workers=1, on_progress=on_progress, chunk_size=2)
+        self.assertEqual(saved, [0, 0, 2, 2, 4])
+
+    def test_submissions_are_read_one_chunk_at_a_time(self):
+        with mock.patch('api.regrade._grade', return_value=True), CaptureQueriesContext(connection) as queries:
+            report = regrade_questions([self.question], workers=1, chunk_size=2)
+        self.assertEqual(report['submissions'], 5)
+        reads = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and '"submitted_code"' in query['sql'] and 'COUNT(' not in query['sql']
+        ]
+        self.assertEqual(len(reads), 3)
+        self.assertTrue(all('LIMIT 2' in sql for sql in reads))
+
+
+@override_settings(**TEST_SETTINGS)
+class SubmissionHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('learner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.question = make_topics(1, questions_per_topic=1)[0].questions.get()
+        for index in range(25):
+            Submission.objects.create(
+                user=self.user, question=self.question, code=f'print({index})', verdict=Submission.VERDICT_FAILED
+            )
+        Submission.objects.create(
+            user=User.objects.create_user('other'), question=self.question, code='secret', verdict=Submission.VERDICT_PASSED
+        )
+        self.url = f'/api/questions/{self.question.id}/submissions/'
+
+    def test_pages_newest_first(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'question', 'code', 'verdict', 'runtime', 'output_size', 'created_at'}
+        )
+        self.assertEqual(response.data['results'][0]['code'], 'print(24)')
+        last_page = self.client.get(self.url, {'page': 2}).data
+        self.assertEqual([row['code'] for row in last_page['results']], [f'print({index})' for index in range(4, -1, -1)])
+        self.assertIsNone(last_page['next'])
+
+    def test_page_size(self):
+        self.assertEqual(len(self.client.get(self.url, {'page_size': 5}).data['results']), 5)
+        self.assertEqual(len(self.client.get(self.url, {'page_size': 1000}).data['results']), 25)
+
+    def test_only_own_submissions(self):
+        codes = [row['code'] for row in self.client.get(self.url, {'page_size': 100}).data['results']]
+        self.assertNotIn('secret', codes)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+@override_settings(**TEST_SETTINGS)
+class JudgeCasesTests(TestCase):
+    """Questions with test cases are graded case by case through /api/submit/."""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question = make_topics(1, questions_per_topic=1)[0].questions.get()
+        self.question.test_cases.create(stdin='2 3', expected_output='5', order=1)
+        self.question.test_cases.create(stdin='10 -4', expected_output='6', order=2)
+        self.question.test_cases.create(stdin='secret input', expected_output='secret output', hidden=True, order=3)
+        self.user = User.objects.create_user('learner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self, code):
+        response = self.client.post(f'/api/submit/{self.question.id}/', {'code': code}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_passes_when_every_case_passes(self):
+        data = self.submit(
+            'import sys\n'
+            'text = sys.stdin.read()\n'
+            'print("secret output" if text == "secret input" else sum(map(int, text.split())))\n'
+        )
+        self.assertTrue(data['passed'])
+        self.assertEqual([case['status'] for case in data['cases']], ['passed'] * 3)
+        self.assertEqual(data['cases'][0]['output'], '5')
+        self.assertTrue(UserProgress.objects.get(user=self.user, question=self.question).completed)
+        self.assertEqual(Submission.objects.get(user=self.user).verdict, Submission.VERDICT_PASSED)
+
+    def test_fail_fast_skips_the_cases_after_a_failure(self):
+        data = self.submit('import sys\nprint(sum(map(int, sys.stdin.read().split())) + 1)\n')
+        self.assertFalse(data['passed'])
+        self.assertEqual([case['status'] for case in data['cases']], ['failed', 'skipped', 'skipped'])
+        self.assertEqual(data['message'], 'Test case 1 of 3: Output does not match expected result')
+        self.assertEqual((data['output'], data['expected']), ('6', '5'))
+        self.assertIsNone(data['cases'][1]['duration_ms'])
+        self.assertNotIn('output', data['cases'][1])
+        self.assertEqual(Submission.objects.get(user=self.user).verdict, Submission.VERDICT_FAILED)
+
+    def test_hidden_cases_show_only_their_status(self):
+        data = self.submit('import sys\nprint(sum(map(int, sys.stdin.read().split())))\n')
+        self.assertFalse(data['passed'])
+        self.assertEqual([case['status'] for case in data['cases']], ['passed', 'passed', 'error'])
+        hidden = data['cases'][2]
+        self.assertEqual(set(hidden), {'case', 'status', 'duration_ms'})
+        self.assertEqual(data['message'], 'Test case 3 of 3: Code has errors')
+        self.assertIsNone(data['output'])
+        self.assertIsNone(data['expected'])
+        self.assertNotIn('secret', str(data))
+
+
+@skipIf(
+    connection.vendor == 'sqlite' and django.VERSION < (5, 1),
+    'SQLite needs IMMEDIATE transactions (Django 5.1+) to serialize writers'
+)
+@override_settings(**TEST_SETTINGS)
+class ConcurrentSubmissionTests(TransactionTestCase):
+    """Parallel submissions from one user must not lose attempts or completions."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner')
+        self.topics = make_topics(2, questions_per_topic=4)
+
+    def run_in_threads(self, function, args):
+        def call(arg):
+            try:
+                return function(arg)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=len(args)) as executor:
+            return list(executor.map(call, args))
+
+    def test_attempts(self):
+        question = self.topics[0].questions.first()
+        counts = self.run_in_threads(lambda _: record_attempt(self.user, question, 'print(1)'), range(8))
+        self.assertEqual(sorted(counts), list(range(1, 9)))
+        self.assertEqual(UserProgress.objects.get(user=self.user, question=question).attempts, 8)
+
+    def test_passes(self):
+        questions = list(self.topics[0].questions.all())
+        for question in questions:
+            record_attempt(self.user, question, 'print(1)')
+        results = self.run_in_threads(lambda question: record_pass(self.user, question), questions)
+        # Exactly one of the passes completes the topic
+        self.assertEqual(sum(1 for topic_completed, _ in results if topic_completed), 1)
+        progress = TopicProgress.objects.get(user=self.user, topic=self.topics[0])
+        self.assertEqual(progress.completed_count, len(questions))
+        self.assertTrue(progress.is_completed)
+        self.assertTrue(TopicProgress.objects.get(user=self.user, topic=self.topics[1]).is_unlocked)
+
+
+@override_settings(**TEST_SETTINGS, EXECUTION_QUEUE={'ENABLED': True, 'POLL_INTERVAL': 0.01})
+class ExecutionJobTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('learner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.question = make_topics(1, questions_per_topic=1)[0].questions.get()
+
+    def submit(self):
+        response = self.client.post(f'/api/submit/{self.question.id}/', {'code': 'print(1)'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def run_queue(self):
+        for job_id in claim_jobs(10):
+            run_job(job_id)
+
+    def test_submit_and_poll(self):
+        job = self.submit()
+        self.assertEqual(self.client.get(job['status_url']).data['status'], 'queued')
+        self.run_queue()
+        data = self.client.get(job['status_url']).data
+        self.assertEqual(data['status'], 'done')
+        self.assertTrue(data['result']['passed'])
+        self.assertEqual(data['result']['attempts'], 1)
+
+    def test_jobs_of_other_users_are_not_found(self):
+        job = self.submit()
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(other.get(job['status_url']).status_code, 404)
+        self.assertEqual(other.get(job['stream_url']).status_code, 404)
+
+    def test_requeued_job_is_counted_once(self):
+        self.submit()
+        # A worker claims the job and dies
+        [job_id] = claim_jobs(1)
+        dead_worker_job = ExecutionJob.objects.get(id=job_id)
+        ExecutionJob.objects.update(started_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.run_queue()
+        # Or it was only slow and finishes after the job was claimed again
+        finish_job(dead_worker_job, ExecutionJob.STATUS_DONE, *check_submission(self.user, self.question, 'print(1)'))
+        self.assertEqual(ExecutionJob.objects.get(id=job_id).result['attempts'], 1)
+        self.assertEqual(UserProgress.objects.get(user=self.user, question=self.question).attempts, 1)
+        self.assertEqual(Submission.objects.filter(user=self.user).count(), 1)
+
+    def test_stream_under_wsgi(self):
+        job = self.submit()
+        self.assertEqual(self.client.get(job['stream_url']).status_code, 204)
+
+    async def test_stream(self):
+        job = await sync_to_async(self.submit)()
+        await sync_to_async(self.run_queue)()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = await AsyncClient().get(job['stream_url'], headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(events.count('event: status'), 1)
+        self.assertIn('"status": "done"', events)
+
+
+@override_settings(**TEST_SETTINGS)
+class QuestionMoveTests(TestCase):
+    def test_completed_count_follows_the_question(self):
+        cache.clear()
+        user = User.objects.create_user('learner')
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = make_topics(2, questions_per_topic=2)
+        question = first.questions.first()
+        record_attempt(user, question, 'print(1)')
+        with self.captureOnCommitCallbacks(execute=True):
+            record_pass(user, question)
+        self.assertEqual(TopicProgress.objects.get(user=user, topic=first).completed_count, 1)
+
+        question.topic = second
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+        counts = dict(TopicProgress.objects.filter(user=user).values_list('topic_id', 'completed_count'))
+        self.assertEqual(counts, {first.id: 0, second.id: 1})
+
+
+@override_settings(**TEST_SETTINGS)
+class MetricsAccessTests(TestCase):
+    def test_staff_session_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(User.objects.create_user('learner'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS={'TOKEN': 'scrape'})
+    def test_bearer_token(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(**TEST_SETTINGS)
+class ValidationFirstTests(TestCase):
+    """Code failing api.validation is answered before keywords, admission or the result cache."""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question = make_topics(1, questions_per_topic=1)[0].questions.get()
+        self.question.required_keywords = 'for'
+        self.question.save()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('learner'))
+
+    def test_submit(self):
+        with mock.patch('api.grading.check_required_keywords') as keywords, \
+                mock.patch('api.result_cache.lookup') as lookup:
+            response = self.client.post(f'/api/submit/{self.question.id}/', {'code': 'print(('}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['passed'])
+        self.assertIn('SyntaxError', response.data['output'])
+        keywords.assert_not_called()
+        lookup.assert_not_called()
+
+    def test_run_code(self):
+        with mock.patch('api.admission.take_token') as take_token, \
+                mock.patch('api.result_cache.lookup') as lookup:
+            response = self.client.post('/api/run-code/', {'code': 'import socket'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("importing 'socket' is not allowed", response.data['error'])
+        take_token.assert_not_called()
+        lookup.assert_not_called()
+
+
+@override_settings(**TEST_SETTINGS, ADMISSION={'RATE': 0.001, 'BURST': 10})
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_is_enforced_under_concurrency(self):
+        cache.clear()
+        start = threading.Barrier(40)
+        def with_latency(method):
+            # A round trip's worth of latency, as with Redis, lets the requests interleave
+            def call(self, *args, **kwargs):
+                time.sleep(0.002)
+                return method(self, *args, **kwargs)
+            return call
+
+        def take(_):
+            start.wait()
+            return take_token(1)
+
+        with mock.patch.object(LocMemCache, 'get', with_latency(LocMemCache.get)), \
+                mock.patch.object(LocMemCache, 'set', with_latency(LocMemCache.set)), \
+                ThreadPoolExecutor(max_workers=40) as executor:
+            waits = list(executor.map(take, range(40)))
+        self.assertEqual(waits.count(0), 10)
+        self.assertTrue(all(wait > 0 for wait in waits if wait))
+
+
+@override_settings(ADMISSION={'ENABLED': True, 'RATE': 0.001, 'BURST': 1})
+class AdmissionCacheTests(SimpleTestCase):
+    def test_off_on_the_file_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        }):
+            for _ in range(3):
+                self.assertIsNone(enter(User(id=1)))
+            self.assertEqual(os.listdir(location), [])
+
+    @override_settings(**TEST_SETTINGS)
+    def test_on_with_an_atomic_cache(self):
+        cache.clear()
+        slot = enter(User(id=1))
+        self.assertIsNotNone(slot)
+        leave(slot)
+        with self.assertRaises(Throttled):
+            enter(User(id=1))
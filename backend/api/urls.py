@@ -10,7 +10,15 @@ urlpatterns = [
     path('dashboard/', views.get_dashboard, name='dashboard'),
     path('topics/', views.get_topics, name='topics'),
     path('topics/<int:topic_id>/', views.get_topic, name='topic_detail'),
+    path('topics/<int:topic_id>/theory/', views.get_topic_theory, name='topic_theory'),
     path('questions/<int:question_id>/', views.get_question, name='question_detail'),
+    path('questions/<int:question_id>/submissions/', views.get_submissions, name='question_submissions'),
     path('run-code/', views.run_code, name='run_code'),
     path('submit/<int:question_id>/', views.submit_code, name='submit_code'),
+    # Native async variants, only served behind an ASGI server (404 under WSGI)
+    path('run-code/async/', views.run_code_async, name='run_code_async'),
+    path('submit/<int:question_id>/async/', views.submit_code_async, name='submit_code_async'),
+    path('jobs/<int:job_id>/', views.get_job, name='job_status'),
+    path('jobs/<int:job_id>/stream/', views.stream_job, name='job_stream'),
+    path('execution/cache-stats/', views.get_result_cache_stats, name='result_cache_stats'),
 ]
\ No newline at end of file
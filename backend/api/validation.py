@@ -0,0 +1,97 @@
+"""
+Static checks run before a submission is executed.
+
+Code that cannot run, or that the policy forbids, is rejected here
+without taking a worker slot or forking a process:
+
+- code larger than MAX_CODE_SIZE bytes (UTF-8) fails with the
+  'code_size' limit;
+- code that does not compile gets the SyntaxError Python would print;
+- imports of BANNED_MODULES (and their submodules) and calls of
+  BANNED_CALLS get an ImportError / NameError pointing at the line.
+
+Rejections are ExecutionResults like any other, so run_code and
+submit_code report them with their usual payloads. The pipeline is
+controlled by settings.CODE_VALIDATION.
+"""
+import ast
+import traceback
+
+from django.conf import settings
+
+from . import metrics
+from .runner import ExecutionResult
+
+FILENAME = 'main.py'
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_CODE_SIZE': 64 * 1024,
+    'BANNED_MODULES': ('ctypes', 'multiprocessing', 'socket', 'subprocess'),
+    'BANNED_CALLS': ('__import__', 'breakpoint'),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'CODE_VALIDATION', {}).get(name, DEFAULTS[name])
+
+
+def _error(code, lineno, message):
+    """stderr in the shape of an uncaught error at `lineno`."""
+    lines = code.splitlines()
+    source = lines[lineno - 1].strip() if 0 < lineno <= len(lines) else ''
+    return f'  File "{FILENAME}", line {lineno}\n    {source}\n{message}\n'
+
+
+def find_banned(code, tree):
+    """The stderr for the first banned import or call in the tree, or None."""
+    banned_modules = set(get_setting('BANNED_MODULES'))
+    banned_calls = set(get_setting('BANNED_CALLS'))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            modules = []
+        for module in modules:
+            if module.split('.')[0] in banned_modules:
+                return 'module', _error(code, node.lineno, f"ImportError: importing '{module}' is not allowed")
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in banned_calls:
+            return 'call', _error(code, node.lineno, f"NameError: calling '{node.func.id}' is not allowed")
+    return None
+
+
+def validate(code):
+    """
+    Return an ExecutionResult rejecting the code without running it, or
+    None when it should be executed.
+    """
+    if not get_setting('ENABLED'):
+        return None
+    max_size = get_setting('MAX_CODE_SIZE')
+    if max_size is not None and len(code.encode('utf-8', errors='replace')) > max_size:
+        return reject('size', ExecutionResult(returncode=1, limit='code_size'))
+    try:
+        tree = ast.parse(code, FILENAME)
+        # Some errors (e.g. 'return' outside function) only surface when compiling
+        compile(tree, FILENAME, 'exec')
+    except (SyntaxError, ValueError) as e:
+        lines = code.splitlines()
+        if isinstance(e, SyntaxError) and e.text is None and e.lineno and e.lineno <= len(lines):
+            # Errors from compiling the tree come without the source line
+            e.text = lines[e.lineno - 1]
+        return reject('syntax', ExecutionResult(stderr=''.join(traceback.format_exception_only(e)), returncode=1))
+    except (RecursionError, MemoryError):
+        # Too deeply nested to check here; the runner reports it
+        return None
+    banned = find_banned(code, tree)
+    if banned is not None:
+        reason, stderr = banned
+        return reject(reason, ExecutionResult(stderr=stderr, returncode=1))
+    return None
+
+
+def reject(reason, result):
+    metrics.REJECTED.inc(reason=reason)
+    return result
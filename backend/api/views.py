@@ -1,51 +1,45 @@
+from asgiref.sync import sync_to_async
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.exceptions import AuthenticationFailed, ParseError, Throttled
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, renderer_classes
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.renderers import JSONRenderer, BaseRenderer
 from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
-from django.utils import timezone
-import subprocess
-import tempfile
-import os
-import re
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+import asyncio
+import functools
+import hmac
+import io
+import json
+import time
 
-from .models import Topic, Question, UserProgress, TopicProgress
+from .models import Question, TopicProgress, ExecutionJob, Submission
 from .serializers import (
     UserRegisterSerializer,
     UserSerializer,
     TopicSerializer,
     TopicDetailSerializer,
     QuestionDetailSerializer,
+    SubmissionSerializer,
 )
-
-
-def normalize_output(text):
-    """Normalize output for comparison"""
-    if text is None:
-        return ""
-    text = text.replace('\r\n', '\n').replace('\r', '\n')
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
-
-
-def check_required_keywords(code, required_keywords):
-    """
-    Check if code contains required keywords.
-    Returns (is_valid, missing_keywords)
-    """
-    if not required_keywords or required_keywords.strip() == '':
-        return True, []
-    
-    keywords = [k.strip().lower() for k in required_keywords.split(',') if k.strip()]
-    code_lower = code.lower()
-    
-    missing = []
-    for keyword in keywords:
-        if keyword not in code_lower:
-            missing.append(keyword)
-    
-    return len(missing) == 0, missing
+from .grading import agrade_submission, grade_submission
+from .curriculum import get_curriculum
+from .progress import progress_version, topic_progress_map
+from .renderers import ORJSONParser, ORJSONRenderer
+from .http_cache import make_etag, not_modified, representation_key, set_validators, version_time
+from . import admission
+from . import jobs
+from . import metrics
+from . import result_cache
+from .runner import get_setting, rejection
 
 
 @api_view(['POST'])
@@ -55,11 +49,11 @@ def register(request):
     if serializer.is_valid():
         user = serializer.save()
         
-        first_topic = Topic.objects.order_by('order').first()
-        if first_topic:
+        first_topic_id = get_curriculum().first_topic_id
+        if first_topic_id:
             TopicProgress.objects.get_or_create(
                 user=user,
-                topic=first_topic,
+                topic_id=first_topic_id,
                 defaults={'is_unlocked': True, 'is_completed': False}
             )
         
@@ -87,39 +81,28 @@ def get_user(request):
 def get_dashboard(request):
     user = request.user
     
-    first_topic = Topic.objects.order_by('order').first()
-    if first_topic:
+    curriculum = get_curriculum()
+    if curriculum.first_topic_id:
         progress, created = TopicProgress.objects.get_or_create(
             user=user,
-            topic=first_topic,
+            topic_id=curriculum.first_topic_id,
             defaults={'is_unlocked': True, 'is_completed': False}
         )
         if not progress.is_unlocked:
             progress.is_unlocked = True
             progress.save()
     
-    total_topics = Topic.objects.count()
-    completed_topics = 0
-    
-    for topic in Topic.objects.all():
-        total_q = topic.questions.count()
-        if total_q > 0:
-            completed_q = UserProgress.objects.filter(
-                user=user,
-                question__topic=topic,
-                completed=True
-            ).count()
-            if completed_q >= total_q:
-                completed_topics += 1
-    
-    total_questions = Question.objects.count()
-    completed_questions = UserProgress.objects.filter(
-        user=user,
-        completed=True
-    ).count()
+    topic_progress = topic_progress_map(user)
+    total_topics = len(topic_progress)
+    completed_topics = sum(1 for p in topic_progress.values() if p['is_completed'])
+    total_questions = sum(p['questions_count'] for p in topic_progress.values())
+    completed_questions = sum(p['completed_count'] for p in topic_progress.values())
     
-    topics = Topic.objects.all().order_by('order')
-    topics_serializer = TopicSerializer(topics, many=True, context={'request': request})
+    topics_serializer = TopicSerializer(
+        curriculum.topic_instances(),
+        many=True,
+        context={'request': request, 'topic_progress': topic_progress}
+    )
     
     return Response({
         'user': UserSerializer(user).data,
@@ -136,64 +119,102 @@ def get_dashboard(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_topics(request):
-    first_topic = Topic.objects.order_by('order').first()
-    if first_topic:
+    curriculum = get_curriculum()
+    if curriculum.first_topic_id:
         progress, created = TopicProgress.objects.get_or_create(
             user=request.user,
-            topic=first_topic,
+            topic_id=curriculum.first_topic_id,
             defaults={'is_unlocked': True, 'is_completed': False}
         )
         if not progress.is_unlocked:
             progress.is_unlocked = True
             progress.save()
     
-    topics = Topic.objects.all().order_by('order')
-    serializer = TopicSerializer(topics, many=True, context={'request': request})
+    serializer = TopicSerializer(curriculum.topic_instances(), many=True, context={'request': request})
     return Response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_topic(request, topic_id):
-    try:
-        topic = Topic.objects.get(id=topic_id)
-    except Topic.DoesNotExist:
+    """Topic metadata and question status; ?fields= selects fields, theory comes from theory_url."""
+    curriculum = get_curriculum()
+    user_version = progress_version(request.user.id)
+    etag = make_etag('topic', topic_id, curriculum.version, request.user.id, user_version, representation_key(request))
+    last_modified = version_time(curriculum.version, user_version)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    
+    if not curriculum.has_topic(topic_id):
         return Response({'error': 'Topic not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    first_topic = Topic.objects.order_by('order').first()
+    topic_progress = topic_progress_map(request.user)
+    if not topic_progress[topic_id]['is_unlocked']:
+        return Response(
+            {'error': 'Topic is locked. Complete previous topics first.'},
+            status=status.HTTP_403_FORBIDDEN
+        )
     
-    if first_topic and topic.id != first_topic.id:
-        is_unlocked = TopicProgress.objects.filter(
-            user=request.user,
-            topic=topic,
-            is_unlocked=True
-        ).exists()
-        
-        if not is_unlocked:
-            return Response(
-                {'error': 'Topic is locked. Complete previous topics first.'},
-                status=status.HTTP_403_FORBIDDEN
-            )
+    topic = curriculum.topic_instance(topic_id)
+    serializer = TopicDetailSerializer(
+        topic,
+        context={'request': request, 'topic_progress': topic_progress}
+    )
+    return set_validators(Response(serializer.data), etag, last_modified)
+
+
+THEORY_MAX_AGE = 60 * 60 * 24 * 365
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def get_topic_theory(request, topic_id):
+    """
+    Topic theory on its own, cacheable by browsers and shared proxies.
+    The signed URL comes from get_topic; it names a curriculum version, so
+    the response for the current version never changes.
+    """
+    curriculum = get_curriculum()
+    version = request.query_params.get('v', '')
+    signature = request.query_params.get('sig', '')
+    if not hmac.compare_digest(signature, curriculum.theory_signature(topic_id, version)):
+        return Response({'error': 'Invalid theory link'}, status=status.HTTP_403_FORBIDDEN)
+    if not curriculum.has_topic(topic_id):
+        return Response({'error': 'Topic not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    serializer = TopicDetailSerializer(topic, context={'request': request})
-    return Response(serializer.data)
+    etag = make_etag('theory', topic_id, curriculum.version)
+    last_modified = version_time(curriculum.version)
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = Response({'id': topic_id, 'theory': curriculum.topics[topic_id]['theory']})
+    if version == str(curriculum.version):
+        return set_validators(response, etag, last_modified, private=False, max_age=THEORY_MAX_AGE, immutable=True)
+    # An older link still works, but its content is not the version it names
+    return set_validators(response, etag, last_modified, private=False)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_question(request, question_id):
+    curriculum = get_curriculum()
+    user_version = progress_version(request.user.id)
+    etag = make_etag('question', question_id, curriculum.version, request.user.id, user_version)
+    last_modified = version_time(curriculum.version, user_version)
+    response = not_modified(request, etag, last_modified)
+    if response is not None:
+        return response
+    
     try:
-        question = Question.objects.get(id=question_id)
+        question = Question.objects.select_related('topic').get(id=question_id)
     except Question.DoesNotExist:
         return Response({'error': 'Question not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    topic = question.topic
-    first_topic = Topic.objects.order_by('order').first()
-    
-    if first_topic and topic.id != first_topic.id:
+    if not curriculum.is_first_topic(question.topic_id):
         is_unlocked = TopicProgress.objects.filter(
             user=request.user,
-            topic=topic,
+            topic_id=question.topic_id,
             is_unlocked=True
         ).exists()
         
@@ -204,7 +225,7 @@ def get_question(request, question_id):
             )
     
     serializer = QuestionDetailSerializer(question, context={'request': request})
-    return Response(serializer.data)
+    return set_validators(Response(serializer.data), etag, last_modified)
 
 
 @api_view(['POST'])
@@ -215,31 +236,33 @@ def run_code(request):
     if not code.strip():
         return Response({'error': 'No code provided'}, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-            f.write(code)
-            temp_file = f.name
-        
-        result = subprocess.run(
-            ['python', temp_file],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            encoding='utf-8'
-        )
-        
-        os.unlink(temp_file)
-        
-        if result.returncode == 0:
-            return Response({'output': result.stdout, 'error': None})
-        else:
-            return Response({'output': None, 'error': result.stderr})
-            
-    except subprocess.TimeoutExpired:
-        os.unlink(temp_file)
-        return Response({'output': None, 'error': 'Code execution timed out (max 5 seconds)'})
-    except Exception as e:
-        return Response({'output': None, 'error': str(e)})
+    # Rejected code never runs, so it costs no admission token
+    rejected = rejection(code)
+    if rejected is not None:
+        return Response(run_code_payload(rejected))
+    
+    with admission.admit(request.user):
+        try:
+            result, _ = result_cache.execute_cached(code, checked=True)
+        except Exception as e:
+            return Response({'output': None, 'error': str(e)})
+    return Response(run_code_payload(result))
+
+
+def run_code_payload(result):
+    if result.timed_out:
+        return {
+            'output': None,
+            'error': f'Code execution timed out (max {get_setting("TIMEOUT")} seconds)'
+        }
+    
+    if result.limit:
+        return {'output': None, 'error': result.limit_message}
+    
+    if result.returncode == 0:
+        return {'output': result.stdout, 'error': None}
+    else:
+        return {'output': None, 'error': result.stderr}
 
 
 @api_view(['POST'])
@@ -255,121 +278,213 @@ def submit_code(request, question_id):
     if not code.strip():
         return Response({'error': 'No code provided'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get or create user progress to track attempts
-    user_progress, created = UserProgress.objects.get_or_create(
-        user=request.user,
-        question=question
+    # In queue mode every submission is a job; without a worker draining the queue none would finish
+    if jobs.get_setting('ENABLED'):
+        # The job worker bounds its own concurrency
+        with admission.admit(request.user, concurrency=False):
+            job = jobs.enqueue(request.user, question, code)
+        return Response(job_accepted_payload(job), status=status.HTTP_202_ACCEPTED)
+    
+    with admission.admit(request.user):
+        payload = grade_submission(request.user, question, code)
+    return Response(payload)
+
+
+def job_accepted_payload(job):
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': reverse('job_status', args=[job.id]),
+        'stream_url': reverse('job_stream', args=[job.id]),
+    }
+
+
+def async_api_view(view):
+    """
+    A minimal @api_view for native async views, which DRF cannot run:
+    POST only, JWT authentication with IsAuthenticated semantics, the JSON
+    body in request.data and dict results rendered as JSON. The views
+    return (data, status); Throttled becomes a 429 with Retry-After.
+
+    ASGI only: under WSGI every request would run on a new event loop,
+    each with its own worker pool, so there the views answer 404 and
+    clients use the sync endpoints.
+    """
+    @csrf_exempt
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not isinstance(request, ASGIRequest):
+            return _json_response({'detail': 'Only served by ASGI servers.'}, 404)
+        if request.method != 'POST':
+            return _json_response({'detail': f'Method "{request.method}" not allowed.'}, 405, Allow='POST')
+        authentication = JWTAuthentication()
+        try:
+            authenticated = await sync_to_async(authentication.authenticate)(request)
+        except AuthenticationFailed as e:
+            authenticated, detail = None, e.detail
+        else:
+            detail = 'Authentication credentials were not provided.'
+        if authenticated is None:
+            # Shaped like DRF's exception handler output
+            return _json_response(detail if isinstance(detail, dict) else {'detail': detail}, 401, **{
+                'WWW-Authenticate': authentication.authenticate_header(request)
+            })
+        request.user = authenticated[0]
+        try:
+            request.data = ORJSONParser().parse(io.BytesIO(request.body or b'{}'))
+        except ParseError as e:
+            return _json_response({'detail': e.detail}, 400)
+        try:
+            data, status_code = await view(request, *args, **kwargs)
+        except Throttled as e:
+            return _json_response({'detail': e.detail}, e.status_code, **{'Retry-After': '%d' % e.wait})
+        return _json_response(data, status_code)
+    return wrapper
+
+
+def _json_response(data, status_code, **headers):
+    return HttpResponse(
+        ORJSONRenderer().render(data), status=status_code, content_type='application/json', headers=headers
     )
+
+
+@async_api_view
+async def run_code_async(request):
+    """run_code for ASGI servers: the run is awaited instead of holding a thread."""
+    code = request.data.get('code', '')
     
-    # Increment attempts
-    user_progress.attempts += 1
-    user_progress.submitted_code = code  # Save code regardless of result
-    user_progress.save()
+    if not code.strip():
+        return {'error': 'No code provided'}, status.HTTP_400_BAD_REQUEST
     
-    # Check required keywords (anti-cheating)
-    is_valid, missing_keywords = check_required_keywords(code, question.required_keywords)
+    rejected = rejection(code)
+    if rejected is not None:
+        return run_code_payload(rejected), status.HTTP_200_OK
     
-    if not is_valid:
-        return Response({
-            'passed': False,
-            'output': None,
-            'expected': question.expected_output,
-            'message': f'Your code must use: {", ".join(missing_keywords)}',
-            'missing_keywords': missing_keywords,
-            'attempts': user_progress.attempts
-        })
+    async with admission.aadmit(request.user):
+        try:
+            result, _ = await result_cache.aexecute_cached(code, checked=True)
+        except Exception as e:
+            return {'output': None, 'error': str(e)}, status.HTTP_200_OK
+    return run_code_payload(result), status.HTTP_200_OK
+
+
+@async_api_view
+async def submit_code_async(request, question_id):
+    """submit_code for ASGI servers; the DB work runs through sync_to_async."""
+    try:
+        question = await Question.objects.aget(id=question_id)
+    except Question.DoesNotExist:
+        return {'error': 'Question not found'}, status.HTTP_404_NOT_FOUND
+    
+    code = request.data.get('code', '')
+    
+    if not code.strip():
+        return {'error': 'No code provided'}, status.HTTP_400_BAD_REQUEST
     
+    # In queue mode every submission is a job; without a worker draining the queue none would finish
+    if jobs.get_setting('ENABLED'):
+        async with admission.aadmit(request.user, concurrency=False):
+            job = await sync_to_async(jobs.enqueue)(request.user, question, code)
+        return job_accepted_payload(job), status.HTTP_202_ACCEPTED
+    
+    async with admission.aadmit(request.user):
+        payload = await agrade_submission(request.user, question, code)
+    return payload, status.HTTP_200_OK
+
+
+class SubmissionPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_submissions(request, question_id):
+    """The user's submission history for a question, newest first."""
+    submissions = Submission.objects.filter(
+        user=request.user,
+        question_id=question_id
+    ).order_by('-created_at', '-id')
+    
+    paginator = SubmissionPagination()
+    page = paginator.paginate_queryset(submissions, request)
+    serializer = SubmissionSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_job(request, job_id):
     try:
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-            f.write(code)
-            temp_file = f.name
-        
-        result = subprocess.run(
-            ['python', temp_file],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            encoding='utf-8'
-        )
-        
-        os.unlink(temp_file)
-        
-        if result.returncode != 0:
-            return Response({
-                'passed': False,
-                'output': result.stderr,
-                'expected': question.expected_output,
-                'message': 'Code has errors',
-                'attempts': user_progress.attempts
-            })
-        
-        actual_output = normalize_output(result.stdout)
-        expected_output = normalize_output(question.expected_output)
-        passed = actual_output == expected_output
-        
-        topic_completed = False
-        next_topic_unlocked = False
-        next_topic_name = None
-        
-        if passed:
-            user_progress.completed = True
-            user_progress.completed_at = timezone.now()
-            user_progress.save()
-            
-            topic = question.topic
-            total_questions = topic.questions.count()
-            completed_questions = UserProgress.objects.filter(
-                user=request.user,
-                question__topic=topic,
-                completed=True
-            ).count()
-            
-            if completed_questions >= total_questions:
-                topic_progress, created = TopicProgress.objects.get_or_create(
-                    user=request.user,
-                    topic=topic
-                )
-                topic_progress.is_completed = True
-                topic_progress.is_unlocked = True
-                topic_progress.save()
-                topic_completed = True
-                
-                next_topic = Topic.objects.filter(order__gt=topic.order).order_by('order').first()
-                if next_topic:
-                    next_progress, created = TopicProgress.objects.get_or_create(
-                        user=request.user,
-                        topic=next_topic
-                    )
-                    next_progress.is_unlocked = True
-                    next_progress.save()
-                    next_topic_unlocked = True
-                    next_topic_name = next_topic.title
-        
-        return Response({
-            'passed': passed,
-            'output': actual_output,
-            'expected': expected_output,
-            'message': 'Correct! Well done!' if passed else 'Output does not match expected result',
-            'topic_completed': topic_completed,
-            'next_topic_unlocked': next_topic_unlocked,
-            'next_topic_name': next_topic_name,
-            'attempts': user_progress.attempts
-        })
-        
-    except subprocess.TimeoutExpired:
-        os.unlink(temp_file)
-        return Response({
-            'passed': False,
-            'output': None,
-            'expected': question.expected_output,
-            'message': 'Code execution timed out',
-            'attempts': user_progress.attempts
-        })
-    except Exception as e:
-        return Response({
-            'passed': False,
-            'output': None,
-            'expected': question.expected_output,
-            'message': str(e),
-            'attempts': user_progress.attempts
-        })
\ No newline at end of file
+        job = ExecutionJob.objects.get(id=job_id, user=request.user)
+    except ExecutionJob.DoesNotExist:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(jobs.serialize_job(job))
+
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def stream_job(request, job_id):
+    """
+    Server-sent events: one `status` event per change, ending with the result.
+
+    ASGI only: the stream waits on the event loop between polls of the
+    job. Under WSGI it would hold a worker thread for up to
+    STREAM_TIMEOUT, so there it answers 204 and clients poll jobs/<id>/.
+    """
+    if not ExecutionJob.objects.filter(id=job_id, user=request.user).exists():
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not isinstance(request._request, ASGIRequest):
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    async def events():
+        deadline = time.monotonic() + jobs.get_setting('STREAM_TIMEOUT')
+        last_status = None
+        while time.monotonic() < deadline:
+            job = await ExecutionJob.objects.aget(id=job_id)
+            if job.status != last_status:
+                last_status = job.status
+                data = json.dumps(jobs.serialize_job(job), cls=DjangoJSONEncoder)
+                yield f'event: status\ndata: {data}\n\n'
+            if job.status in (ExecutionJob.STATUS_DONE, ExecutionJob.STATUS_FAILED):
+                return
+            await asyncio.sleep(jobs.get_setting('POLL_INTERVAL'))
+        yield 'event: timeout\ndata: {}\n\n'
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_result_cache_stats(request):
+    return Response(result_cache.get_cache().stats())
+
+
+def get_metrics(request):
+    """
+    Prometheus scrape endpoint. Requires METRICS['TOKEN'] as a bearer
+    token when set, and a staff session (the admin login) otherwise.
+    """
+    if not metrics.get_setting('ENABLED'):
+        return HttpResponse(status=404)
+    token = metrics.get_setting('TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not request.user.is_staff:
+        return HttpResponse(status=401 if request.user.is_anonymous else 403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,16 +1,17 @@
 from django import template
-from api.models import Topic, Question, UserProgress
+from api.curriculum import get_curriculum
+from api.models import UserProgress
 from django.contrib.auth.models import User
 
 register = template.Library()
 
 @register.simple_tag
 def get_total_topics():
-    return Topic.objects.count()
+    return len(get_curriculum().topic_ids)
 
 @register.simple_tag
 def get_total_questions():
-    return Question.objects.count()
+    return get_curriculum().total_questions
 
 @register.simple_tag
 def get_total_users():
@@ -1,7 +1,9 @@
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 import dj_database_url
+import django
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,9 +33,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Only active when PROFILING['ENABLED'] is set
+    'api.profiling.ProfilingMiddleware',
+    # Outside everything else that reads or changes the body
+    'api.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise that does not force ASGI requests through a single thread
+    'api.staticfiles.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,6 +79,34 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # A file rather than shared-cache memory, so threaded tests wait
+            # for SQLite's write lock instead of failing with "table is locked"
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'pylearn-test.sqlite3')},
+        }
+    }
+    if django.VERSION >= (5, 1):
+        # SQLite ignores select_for_update; taking the write lock at BEGIN
+        # keeps concurrent progress updates serialized instead of failing
+        DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE'}
+
+# Cache shared by all worker processes (curriculum snapshot and its version key)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pylearn-cache')),
+            # Past MAX_ENTRIES files a set deletes a random third of them, the
+            # curriculum keys included. Django's default of 300 is reached
+            # once a few hundred users have a progress version.
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '20000'))},
         }
     }
 
@@ -97,6 +132,24 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # orjson when installed, DRF's own JSON encoding otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+# Response compression - brotli when installed, gzip otherwise
+COMPRESSION = {
+    'ENABLED': os.environ.get('COMPRESSION_ENABLED', 'True').lower() == 'true',
+    'MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    'GZIP_LEVEL': int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6')),
+    'BROTLI_QUALITY': int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '4')),
 }
 
 SIMPLE_JWT = {
@@ -104,6 +157,92 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
 
+# Code execution - warm interpreter pool used by run_code / submit_code
+CODE_RUNNER = {
+    'POOL_SIZE': int(os.environ.get('CODE_RUNNER_POOL_SIZE', '4')),
+    'MAX_RUNS_PER_WORKER': int(os.environ.get('CODE_RUNNER_MAX_RUNS', '200')),
+    # Start worker interpreters in the background on a process's first request
+    'PRESTART': os.environ.get('CODE_RUNNER_PRESTART', 'True').lower() == 'true',
+    'TIMEOUT': 5,
+    # Per-run limits applied to the submission's process
+    'CPU_TIME': 5,
+    'MEMORY': 256 * 1024 * 1024,
+    'MAX_PROCESSES': 0,
+    'FILE_SIZE': 1024 * 1024,
+    'MAX_OUTPUT': int(os.environ.get('CODE_RUNNER_MAX_OUTPUT', str(1024 * 1024))),
+    # stdout kept for display while grading compares it against the expected output
+    'OUTPUT_PREVIEW': 64 * 1024,
+}
+
+# Static checks that reject submissions before a process is started
+CODE_VALIDATION = {
+    'ENABLED': os.environ.get('CODE_VALIDATION_ENABLED', 'True').lower() == 'true',
+    'MAX_CODE_SIZE': int(os.environ.get('CODE_VALIDATION_MAX_CODE_SIZE', str(64 * 1024))),
+    'BANNED_MODULES': ('ctypes', 'multiprocessing', 'socket', 'subprocess'),
+    'BANNED_CALLS': ('__import__', 'breakpoint'),
+}
+
+# Per-user token bucket and cluster-wide concurrency cap for run-code/submit.
+# On by default only with Redis; the file cache cannot support it.
+ADMISSION = {
+    'ENABLED': os.environ.get('ADMISSION_ENABLED', str(bool(REDIS_URL))).lower() == 'true',
+    'RATE': float(os.environ.get('ADMISSION_RATE', '0.5')),
+    'BURST': int(os.environ.get('ADMISSION_BURST', '10')),
+    'MAX_CONCURRENT': int(os.environ.get('ADMISSION_MAX_CONCURRENT', '32')),
+    'SLOT_TIMEOUT': 30,
+    'RETRY_AFTER': 1,
+    'LOCK_WAIT': 1.0,
+}
+
+# Per-process LRU of execution results for byte-identical submissions
+RESULT_CACHE = {
+    'ENABLED': os.environ.get('RESULT_CACHE_ENABLED', 'True').lower() == 'true',
+    'MAX_ENTRIES': int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '5000')),
+}
+
+# Job queue mode: submit_code enqueues and `manage.py run_execution_worker` grades
+EXECUTION_QUEUE = {
+    'ENABLED': os.environ.get('EXECUTION_QUEUE_ENABLED', 'False').lower() == 'true',
+    'CONCURRENCY': int(os.environ.get('EXECUTION_QUEUE_CONCURRENCY', '4')),
+}
+
+# Regrades started from the QuestionAdmin action run `manage.py regrade_questions`
+# in the background and append their report to LOG_FILE
+REGRADE = {
+    'CHUNK_SIZE': int(os.environ.get('REGRADE_CHUNK_SIZE', '500')),
+    'LOG_FILE': os.environ.get('REGRADE_LOG_FILE', os.path.join(tempfile.gettempdir(), 'pylearn-regrade.log')),
+}
+
+# Execution metrics served at /metrics; each process writes its values to
+# DIRECTORY, which must be shared by all gunicorn workers (and cleared on deploy).
+# Scrapers send TOKEN as a bearer token; without one only staff sessions get in
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', 'True').lower() == 'true',
+    'DIRECTORY': os.environ.get('METRICS_DIRECTORY', os.path.join(tempfile.gettempdir(), 'pylearn-metrics')),
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+# Per-request Server-Timing headers and JSON log lines; SAMPLE_RATE > 0 also
+# keeps cProfile/pyinstrument profiles of the slowest sampled requests
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true',
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', '0')),
+    'PROFILER': os.environ.get('PROFILING_PROFILER', 'cprofile'),
+    'SLOWEST': int(os.environ.get('PROFILING_SLOWEST', '20')),
+    'DIRECTORY': os.environ.get('PROFILING_DIRECTORY', os.path.join(tempfile.gettempdir(), 'pylearn-profiles')),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # CORS - Allow ALL origins
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -4,6 +4,8 @@ from django.http import JsonResponse
 from django.shortcuts import redirect
 from django.contrib.auth import logout
 
+from api.views import get_metrics
+
 
 def home(request):
     return JsonResponse({
@@ -35,5 +37,6 @@ urlpatterns = [
     path('admin-logout/', admin_logout_view, name='admin_logout'),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', get_metrics, name='metrics'),
     path('summernote/', include('django_summernote.urls')),
 ]
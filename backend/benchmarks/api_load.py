@@ -0,0 +1,307 @@
+"""
+Load benchmark for the API endpoints.
+
+Drives dashboard/, topics/, topics/<id>/, questions/<id>/, run-code/ and
+submit/<id>/ as randomly chosen synthetic learners and reports, per
+endpoint, throughput, latency percentiles, DB queries per request and
+peak RSS. Results are written as JSON and can be compared against an
+earlier run; the exit status is 1 when an endpoint regressed by more than
+--threshold.
+
+In-process, through the Django test client (counts queries, measures this
+process's RSS):
+
+    python benchmarks/api_load.py --users 2000 --output before.json
+    python benchmarks/api_load.py --users 2000 --output after.json --baseline before.json
+
+Over HTTP from several processes against a running server that uses the
+same database and SECRET_KEY (pass --server-pid to report its peak RSS):
+
+    python benchmarks/data.py --users 2000
+    python benchmarks/api_load.py --driver http --base-url http://127.0.0.1:8000 --processes 8
+
+submit/<id>/ records real attempts, so only run this against a scratch
+database. run-code/ and submit/<id>/ go through admission control;
+requests it refuses are counted as 429 in status_codes. Set
+ADMISSION_ENABLED=False on the server to measure raw capacity.
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import data  # noqa: E402
+
+ENDPOINTS = ('dashboard', 'topics', 'topic_detail', 'question_detail', 'run_code', 'submit_code')
+SAMPLE_USERS = 200
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    data.add_arguments(parser)
+    parser.set_defaults(users=2000)
+    parser.add_argument('--driver', choices=('client', 'http'), default='client')
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--processes', type=int, default=4, help='HTTP driver processes')
+    parser.add_argument('--server-pid', type=int, help='Report the peak RSS of this server process')
+    parser.add_argument('--repeat-code', action='store_true',
+                        help='Submit identical code so the result cache answers repeats')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown that counts as a regression')
+    return parser.parse_args()
+
+
+def build_plan(count, rng, repeat_code):
+    """
+    Return {endpoint: [(user_id, method, path, body), ...]} with requests a
+    learner could make: topics and questions are picked among the ones
+    each sampled user has unlocked.
+    """
+    from api.curriculum import get_curriculum
+    from api.models import Question, TopicProgress
+
+    user_ids = rng.sample(data.bench_user_ids(), min(SAMPLE_USERS, len(data.bench_user_ids())))
+    curriculum = get_curriculum()
+    unlocked = {user_id: {curriculum.first_topic_id} for user_id in user_ids}
+    for user_id, topic_id in TopicProgress.objects.filter(
+        user_id__in=user_ids, is_unlocked=True
+    ).values_list('user_id', 'topic_id'):
+        unlocked[user_id].add(topic_id)
+    questions = {}
+    for question_id, topic_id in Question.objects.values_list('id', 'topic_id'):
+        questions.setdefault(topic_id, []).append(question_id)
+
+    def request(endpoint, i):
+        user_id = rng.choice(user_ids)
+        topic_id = rng.choice(sorted(unlocked[user_id]))
+        question_id = rng.choice(questions[topic_id])
+        # A trailing comment changes the code hash, so every run really executes
+        code = f'print("{data.EXPECTED_OUTPUT}")' + ('' if repeat_code else f'  # {i}')
+        return {
+            'dashboard': (user_id, 'GET', '/api/dashboard/', None),
+            'topics': (user_id, 'GET', '/api/topics/', None),
+            'topic_detail': (user_id, 'GET', f'/api/topics/{topic_id}/', None),
+            'question_detail': (user_id, 'GET', f'/api/questions/{question_id}/', None),
+            'run_code': (user_id, 'POST', '/api/run-code/', {'code': code}),
+            'submit_code': (user_id, 'POST', f'/api/submit/{question_id}/', {'code': code}),
+        }[endpoint]
+
+    return {endpoint: [request(endpoint, i) for i in range(count)] for endpoint in ENDPOINTS}
+
+
+def peak_rss_kb(pid=None):
+    """Peak resident set size in KiB of this process, or of `pid` on Linux."""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def summarize(latencies, statuses, elapsed, queries, rss_kb):
+    latencies = sorted(latencies)
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for code in statuses if code >= 400),
+        'status_codes': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'mean': statistics.fmean(latencies),
+            'p50': percentiles[49],
+            'p90': percentiles[89],
+            'p99': percentiles[98],
+            'max': latencies[-1],
+        },
+        'queries': {
+            'mean': statistics.fmean(queries),
+            'max': max(queries),
+        } if queries else None,
+        'peak_rss_kb': rss_kb,
+    }
+
+
+def run_client(plan):
+    """Drive the endpoints in this process through the DRF test client."""
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.test import APIClient
+
+    users = User.objects.in_bulk({user_id for requests in plan.values() for user_id, *_ in requests})
+    client = APIClient()
+    results = {}
+    for endpoint, requests in plan.items():
+        latencies, statuses, queries = [], [], []
+        started = time.perf_counter()
+        for user_id, method, path, body in requests:
+            client.force_authenticate(users[user_id])
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = getattr(client, method.lower())(path, body, format='json')
+                latencies.append((time.perf_counter() - request_started) * 1000)
+            statuses.append(response.status_code)
+            queries.append(len(captured))
+        results[endpoint] = summarize(latencies, statuses, time.perf_counter() - started, queries, peak_rss_kb())
+    return results
+
+
+def _http_batch(base_url, requests):
+    latencies, statuses = [], []
+    for token, method, path, body in requests:
+        payload = json.dumps(body).encode('utf-8') if body is not None else None
+        http_request = Request(base_url + path, data=payload, method=method, headers={
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json',
+        })
+        started = time.perf_counter()
+        try:
+            with urlopen(http_request) as response:
+                response.read()
+                status = response.status
+        except HTTPError as e:
+            e.read()
+            status = e.code
+        latencies.append((time.perf_counter() - started) * 1000)
+        statuses.append(status)
+    return latencies, statuses
+
+
+def run_http(plan, base_url, processes, server_pid):
+    """Drive a running server from several processes over HTTP."""
+    from django.contrib.auth.models import User
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    users = User.objects.in_bulk({user_id for requests in plan.values() for user_id, *_ in requests})
+    tokens = {user_id: str(AccessToken.for_user(user)) for user_id, user in users.items()}
+    results = {}
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for endpoint, requests in plan.items():
+            requests = [(tokens[user_id], method, path, body) for user_id, method, path, body in requests]
+            batches = [requests[i::processes] for i in range(processes)]
+            started = time.perf_counter()
+            latencies, statuses = [], []
+            for batch_latencies, batch_statuses in executor.map(_http_batch, [base_url] * processes, batches):
+                latencies.extend(batch_latencies)
+                statuses.extend(batch_statuses)
+            results[endpoint] = summarize(
+                latencies, statuses, time.perf_counter() - started, None,
+                peak_rss_kb(server_pid) if server_pid else None
+            )
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, cwd=Path(__file__).resolve().parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results):
+    print(f'{"endpoint":<16} {"req/s":>9} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"queries":>8} {"errors":>7} {"rss MiB":>8}')
+    for endpoint, result in results.items():
+        latency = result['latency_ms']
+        queries = f'{result["queries"]["mean"]:.1f}' if result['queries'] else '-'
+        rss = f'{result["peak_rss_kb"] / 1024:.0f}' if result['peak_rss_kb'] else '-'
+        print(f'{endpoint:<16} {result["throughput"]:>9.1f} {latency["p50"]:>8.2f} {latency["p90"]:>8.2f} '
+              f'{latency["p99"]:>8.2f} {queries:>8} {result["errors"]:>7} {rss:>8}')
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline run. Returns the regressed endpoints."""
+    regressions = []
+    print(f'\nAgainst baseline {baseline["meta"].get("revision")} ({baseline["meta"]["created_at"]}):')
+    for endpoint, result in results.items():
+        before = baseline['endpoints'].get(endpoint)
+        if before is None:
+            continue
+        changes = {
+            'p50': result['latency_ms']['p50'] / before['latency_ms']['p50'] - 1,
+            'p99': result['latency_ms']['p99'] / before['latency_ms']['p99'] - 1,
+        }
+        if result['queries'] and before['queries'] and before['queries']['mean']:
+            changes['queries'] = result['queries']['mean'] / before['queries']['mean'] - 1
+        if before['throughput']:
+            changes['req/s'] = result['throughput'] / before['throughput'] - 1
+        # Latency and queries regress when they grow, throughput when it drops
+        regressed = [
+            name for name, change in changes.items()
+            if (-change if name == 'req/s' else change) > threshold
+        ]
+        if regressed:
+            regressions.append(endpoint)
+        summary = ', '.join(
+            f'{name} {"+" if change >= 0 else ""}{change * 100:.1f}%' for name, change in changes.items()
+        )
+        print(f'  {endpoint:<16} {summary}{"  REGRESSION: " + ", ".join(regressed) if regressed else ""}')
+    return regressions
+
+
+def main():
+    args = parse_args()
+    data.setup_django(args.database_url)
+    from django.db import connection
+
+    rng = random.Random(args.seed)
+    data.ensure_seeded(args, rng)
+    plan = build_plan(args.requests, rng, args.repeat_code)
+    plan = {endpoint: plan[endpoint] for endpoint in args.endpoints}
+
+    if args.driver == 'client':
+        results = run_client(plan)
+    else:
+        results = run_http(plan, args.base_url, args.processes, args.server_pid)
+
+    output = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'driver': args.driver,
+            'processes': args.processes if args.driver == 'http' else 1,
+            'requests_per_endpoint': args.requests,
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'users': len(data.bench_user_ids()),
+        },
+        'endpoints': results,
+    }
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+        print(f'\nWrote {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Synthetic course and learner data for the benchmarks.
+
+Generates topics, questions, users and their progress at a configurable
+scale into a scratch database. Run it directly to seed a database for a
+server that the HTTP load driver will hit:
+
+    python benchmarks/data.py --database-url sqlite:////tmp/pylearn-bench.sqlite3 --users 10000
+
+Never point --database-url at a real database.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'pylearn-bench.sqlite3')
+QUESTIONS_PER_TOPIC = 10
+USERNAME_PREFIX = 'bench'
+EXPECTED_OUTPUT = 'x'
+
+
+def setup_django(database_url):
+    """Configure Django against the scratch database and migrate it."""
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def add_arguments(parser):
+    parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--questions', type=int, default=200)
+    parser.add_argument('--reseed', action='store_true', help='Flush and seed again even if data exists')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def is_seeded():
+    from django.contrib.auth.models import User
+    return User.objects.filter(username__startswith=USERNAME_PREFIX).exists()
+
+
+def seed(users, questions, rng, batch_size=10000):
+    """Each user has worked through a random prefix of the course, like real learners do."""
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from api.models import Topic, Question, UserProgress, TopicProgress
+
+    topic_count = max(1, -(-questions // QUESTIONS_PER_TOPIC))
+    Topic.objects.bulk_create(
+        Topic(title=f'Topic {i}', theory=f'<p>Theory for topic {i}</p>' * 20, order=i)
+        for i in range(topic_count)
+    )
+    topic_ids = list(Topic.objects.order_by('order').values_list('id', flat=True))
+    Question.objects.bulk_create(
+        Question(topic_id=topic_ids[i // QUESTIONS_PER_TOPIC], title=f'Question {i}',
+                 description='', expected_output=EXPECTED_OUTPUT, order=i % QUESTIONS_PER_TOPIC)
+        for i in range(questions)
+    )
+    question_rows = list(Question.objects.order_by('topic__order', 'order').values_list('id', 'topic_id'))
+
+    for start in range(0, users, batch_size):
+        with transaction.atomic():
+            User.objects.bulk_create(
+                User(username=f'{USERNAME_PREFIX}{i}', password='!')
+                for i in range(start, min(start + batch_size, users))
+            )
+    user_ids = bench_user_ids()
+
+    progress = []
+    topic_progress = []
+
+    def flush():
+        with transaction.atomic():
+            UserProgress.objects.bulk_create(progress, batch_size=batch_size)
+            TopicProgress.objects.bulk_create(topic_progress, batch_size=batch_size)
+        progress.clear()
+        topic_progress.clear()
+
+    for user_id in user_ids:
+        reached = rng.randint(0, len(question_rows))
+        completed_by_topic = {}
+        for index, (question_id, topic_id) in enumerate(question_rows[:reached]):
+            # The question a learner stopped at is usually still failing
+            completed = index < reached - 1 or rng.random() < 0.5
+            progress.append(UserProgress(user_id=user_id, question_id=question_id, completed=completed,
+                                         attempts=rng.randint(1, 5), submitted_code='print("x")'))
+            completed_by_topic[topic_id] = completed_by_topic.get(topic_id, 0) + completed
+        for order, topic_id in enumerate(topic_ids):
+            if order and topic_id not in completed_by_topic and topic_ids[order - 1] not in completed_by_topic:
+                break
+            topic_progress.append(TopicProgress(
+                user_id=user_id,
+                topic_id=topic_id,
+                is_unlocked=True,
+                is_completed=completed_by_topic.get(topic_id, 0) >= QUESTIONS_PER_TOPIC,
+                completed_count=completed_by_topic.get(topic_id, 0)
+            ))
+        if len(progress) >= batch_size:
+            flush()
+    flush()
+
+
+def bench_user_ids():
+    from django.contrib.auth.models import User
+    return list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id').values_list('id', flat=True))
+
+
+def ensure_seeded(args, rng):
+    from django.core.management import call_command
+
+    if args.reseed:
+        call_command('flush', interactive=False, verbosity=0)
+    if not is_seeded():
+        started = time.monotonic()
+        seed(args.users, args.questions, rng)
+        print(f'Seeded {args.users} users x {args.questions} questions in {time.monotonic() - started:.1f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    setup_django(args.database_url)
+    ensure_seeded(args, random.Random(args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Query plan and latency benchmark for the progress lookups.
+
+Seeds a scratch database with users x questions worth of progress rows,
+then reports the EXPLAIN plan and p50/p99 latency of every hot progress
+query twice: without the indexes added by the progress indexes
+migration and with them. The schema stays at the latest migration, so
+the data is always seeded with the current models; only those indexes
+are dropped and rebuilt.
+
+    python benchmarks/progress_queries.py --users 100000 --questions 200
+    python benchmarks/progress_queries.py --database-url postgres://localhost/pylearn_bench
+
+Never point --database-url at a real database: indexes are dropped and
+rebuilt and --reseed flushes every table.
+"""
+import argparse
+import importlib
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import data  # noqa: E402
+
+INDEX_MIGRATION = 'api.migrations.0007_progress_indexes'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    data.add_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=1000)
+    return parser.parse_args()
+
+
+def hot_queries():
+    """The progress queries the API runs on every request, by name."""
+    from django.db.models import Count
+    from api.models import UserProgress, TopicProgress
+
+    return {
+        'topic_progress_map': lambda user_id, topic_id: (
+            TopicProgress.objects.filter(user_id=user_id)
+            .values_list('topic_id', 'is_unlocked', 'completed_count')
+        ),
+        'question_progress_map': lambda user_id, topic_id: (
+            UserProgress.objects.filter(user_id=user_id, question__topic_id=topic_id)
+            .values('question_id', 'completed', 'submitted_code', 'attempts')
+        ),
+        'topic_unlocked': lambda user_id, topic_id: (
+            TopicProgress.objects.filter(user_id=user_id, topic_id=topic_id, is_unlocked=True)
+            .values_list('id', flat=True)[:1]
+        ),
+        'record_pass_rows': lambda user_id, topic_id: (
+            UserProgress.objects.filter(user_id=user_id, question__topic_id=topic_id)
+            .order_by('id')
+            .values_list('question_id', 'completed')
+        ),
+        'completed_per_topic': lambda user_id, topic_id: (
+            UserProgress.objects.filter(user_id=user_id, completed=True)
+            .values('question__topic_id')
+            .annotate(total=Count('id'))
+            .values_list('question__topic_id', 'total')
+        ),
+    }
+
+
+def progress_indexes():
+    """(model, index) for every AddIndex of the progress indexes migration."""
+    from django.apps import apps
+
+    migration = importlib.import_module(INDEX_MIGRATION).Migration
+    return [(apps.get_model('api', operation.model_name), operation.index) for operation in migration.operations]
+
+
+def existing_constraints(model):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        return connection.introspection.get_constraints(cursor, model._meta.db_table)
+
+
+def drop_indexes():
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model, index in progress_indexes():
+            # Already gone when an earlier run stopped before rebuilding them
+            if index.name in existing_constraints(model):
+                editor.remove_index(model, index)
+
+
+def build_indexes():
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model, index in progress_indexes():
+            if index.name not in existing_constraints(model):
+                editor.add_index(model, index)
+
+
+def measure(iterations, rng):
+    from api.models import Topic
+
+    user_ids = data.bench_user_ids()
+    topic_ids = list(Topic.objects.values_list('id', flat=True))
+    sample_user, sample_topic = user_ids[len(user_ids) // 2], topic_ids[len(topic_ids) // 2]
+
+    results = {}
+    for name, build in hot_queries().items():
+        plan = build(sample_user, sample_topic).explain()
+        timings = []
+        for _ in range(iterations):
+            queryset = build(rng.choice(user_ids), rng.choice(topic_ids))
+            started = time.perf_counter()
+            list(queryset)
+            timings.append((time.perf_counter() - started) * 1000)
+        percentiles = statistics.quantiles(timings, n=100)
+        results[name] = {'plan': plan, 'p50': percentiles[49], 'p99': percentiles[98]}
+    return results
+
+
+def report(label, results):
+    print(f'\n=== {label} ===')
+    for name, result in results.items():
+        print(f'\n{name}: p50 {result["p50"]:.3f} ms, p99 {result["p99"]:.3f} ms')
+        for line in result['plan'].splitlines():
+            print(f'    {line}')
+
+
+def main():
+    args = parse_args()
+    data.setup_django(args.database_url)
+
+    rng = random.Random(args.seed)
+    data.ensure_seeded(args, rng)
+
+    drop_indexes()
+    before = measure(args.iterations, rng)
+    started = time.monotonic()
+    build_indexes()
+    print(f'Built indexes in {time.monotonic() - started:.1f}s')
+    after = measure(args.iterations, rng)
+
+    report('before (without the progress indexes)', before)
+    report('after (latest schema)', after)
+    print('\n=== summary (ms) ===')
+    print(f'{"query":<24} {"p50 before":>11} {"p50 after":>10} {"p99 before":>11} {"p99 after":>10}')
+    for name in before:
+        print(f'{name:<24} {before[name]["p50"]:>11.3f} {after[name]["p50"]:>10.3f} '
+              f'{before[name]["p99"]:>11.3f} {after[name]["p99"]:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Rendering and compression benchmark for the API responses.
+
+Fetches the dashboard/, topics/, topics/<id>/, theory and
+questions/<id>/ payloads of a sample of synthetic learners, then reports
+per endpoint the CPU time to render them with DRF's JSONRenderer and with
+the orjson renderer, and the size and CPU cost of every available
+compression (gzip at the configured level, brotli when installed).
+
+    python benchmarks/responses.py --users 2000 --iterations 200
+    python benchmarks/responses.py --output responses.json
+
+Rendering and compression are timed on the same payloads outside the
+request cycle, so the numbers are per response and free of DB time.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import data  # noqa: E402
+
+SAMPLE_USERS = 20
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    data.add_arguments(parser)
+    parser.set_defaults(users=2000)
+    parser.add_argument('--iterations', type=int, default=200, help='Timed repetitions per payload')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    return parser.parse_args()
+
+
+def fetch_payloads(rng):
+    """Return {endpoint: [response.data, ...]} for a sample of learners."""
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIClient
+    from api.models import Question, TopicProgress
+
+    user_ids = rng.sample(data.bench_user_ids(), min(SAMPLE_USERS, len(data.bench_user_ids())))
+    questions = {}
+    for question_id, topic_id in Question.objects.values_list('id', 'topic_id'):
+        questions.setdefault(topic_id, []).append(question_id)
+    client = APIClient()
+    payloads = {'dashboard': [], 'topics': [], 'topic_detail': [], 'theory': [], 'question_detail': []}
+    for user in User.objects.filter(id__in=user_ids):
+        client.force_authenticate(user)
+        topic_id = rng.choice(list(
+            TopicProgress.objects.filter(user=user, is_unlocked=True).values_list('topic_id', flat=True)
+        ))
+        topic = client.get(f'/api/topics/{topic_id}/').data
+        payloads['dashboard'].append(client.get('/api/dashboard/').data)
+        payloads['topics'].append(client.get('/api/topics/').data)
+        payloads['topic_detail'].append(topic)
+        payloads['theory'].append(client.get(topic['theory_url']).data)
+        payloads['question_detail'].append(client.get(f'/api/questions/{rng.choice(questions[topic_id])}/').data)
+    return payloads
+
+
+def cpu_ms(function, payloads, iterations):
+    """Mean CPU milliseconds per call of function over the payloads."""
+    started = time.process_time()
+    for _ in range(iterations):
+        for payload in payloads:
+            function(payload)
+    return (time.process_time() - started) * 1000 / (iterations * len(payloads))
+
+
+def measure(payloads, iterations):
+    from rest_framework.renderers import JSONRenderer
+    from api import renderers
+    from api.compression import get_encoders
+
+    renderer = JSONRenderer()
+    fast_renderer = renderers.ORJSONRenderer()
+    encoders = get_encoders()
+    results = {}
+    for endpoint, items in payloads.items():
+        bodies = [renderer.render(item) for item in items]
+        assert bodies == [fast_renderer.render(item) for item in items], f'{endpoint}: renderers disagree'
+        result = {
+            'bytes': statistics.fmean(len(body) for body in bodies),
+            'render_ms': {'json': cpu_ms(renderer.render, items, iterations)},
+            'compression': {},
+        }
+        if renderers.orjson is not None:
+            result['render_ms']['orjson'] = cpu_ms(fast_renderer.render, items, iterations)
+        for coding, compress in encoders.items():
+            result['compression'][coding] = {
+                'bytes': statistics.fmean(len(compress(body)) for body in bodies),
+                'cpu_ms': cpu_ms(compress, bodies, iterations),
+            }
+        results[endpoint] = result
+    return results
+
+
+def report(results):
+    codings = sorted({coding for result in results.values() for coding in result['compression']})
+    header = f'{"endpoint":<16} {"bytes":>8} {"json ms":>8} {"orjson ms":>9}'
+    for coding in codings:
+        header += f' {coding + " bytes":>11} {"saved":>6} {coding + " ms":>8}'
+    print(header)
+    for endpoint, result in results.items():
+        orjson_ms = result['render_ms'].get('orjson')
+        line = (f'{endpoint:<16} {result["bytes"]:>8.0f} {result["render_ms"]["json"]:>8.3f} '
+                f'{orjson_ms if orjson_ms is not None else float("nan"):>9.3f}')
+        for coding in codings:
+            compression = result['compression'][coding]
+            saved = 1 - compression['bytes'] / result['bytes'] if result['bytes'] else 0.0
+            line += f' {compression["bytes"]:>11.0f} {saved * 100:>5.0f}% {compression["cpu_ms"]:>8.3f}'
+        print(line)
+
+
+def main():
+    args = parse_args()
+    data.setup_django(args.database_url)
+
+    rng = random.Random(args.seed)
+    data.ensure_seeded(args, rng)
+    results = measure(fetch_payloads(rng), args.iterations)
+    report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nWrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
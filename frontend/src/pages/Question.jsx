@@ -73,7 +73,11 @@ const Question = () => {
                 setOutput(response.output || '(No output)');
             }
         } catch (err) {
-            setOutput('Error: Failed to run code. Please check your connection and try again.');
+            if (err.response?.status === 429) {
+                setOutput(`Error: ${err.response.data.detail}`);
+            } else {
+                setOutput('Error: Failed to run code. Please check your connection and try again.');
+            }
             console.error('Run code error:', err);
         } finally {
             setRunning(false);
@@ -101,7 +105,13 @@ const Question = () => {
                 setQuestion(updatedQuestion);
             }
         } catch (err) {
-            setOutput('Error: Failed to submit code. Please check your connection and try again.');
+            if (err.response?.status === 429) {
+                setOutput(`Error: ${err.response.data.detail}`);
+            } else if (err.pollTimeout) {
+                setOutput(`Error: ${err.message}`);
+            } else {
+                setOutput('Error: Failed to submit code. Please check your connection and try again.');
+            }
             console.error('Submit error:', err);
         } finally {
             setSubmitting(false);
@@ -267,7 +277,19 @@ const Question = () => {
                                 </p>
                             )}
                             
-                            {!result.passed && !result.missing_keywords && (
+                            {result.cases && (
+                                <ul className="test-case-list">
+                                    {result.cases.map((testCase) => (
+                                        <li key={testCase.case} className={`test-case ${testCase.status}`}>
+                                            <span>Test case {testCase.case}</span>
+                                            <span>{testCase.status}</span>
+                                            {testCase.duration_ms !== null && <span>{testCase.duration_ms} ms</span>}
+                                        </li>
+                                    ))}
+                                </ul>
+                            )}
+                            
+                            {!result.passed && !result.missing_keywords && result.expected != null && (
                                 <div className="result-comparison">
                                     <div className="comparison-item">
                                         <strong>Your Output:</strong>
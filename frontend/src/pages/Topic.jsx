@@ -1,12 +1,13 @@
 import { useState, useEffect } from 'react';
 import { useParams, Link, useNavigate } from 'react-router-dom';
-import { getTopic, getTopics } from '../services/api';
+import { getTopic, getTopics, getTheory } from '../services/api';
 import Sidebar from '../components/Sidebar';
 
 const Topic = () => {
     const { topicId } = useParams();
     const navigate = useNavigate();
     const [topic, setTopic] = useState(null);
+    const [theory, setTheory] = useState(null);
     const [allTopics, setAllTopics] = useState([]);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState('');
@@ -25,6 +26,7 @@ const Topic = () => {
             ]);
             setTopic(topicData);
             setAllTopics(topicsData);
+            fetchTheory(topicData.theory_url);
         } catch (err) {
             if (err.response?.status === 403) {
                 setError('This topic is locked. Complete previous topics first.');
@@ -39,6 +41,16 @@ const Topic = () => {
         }
     };
 
+    const fetchTheory = async (theoryUrl) => {
+        setTheory(null);
+        try {
+            setTheory(await getTheory(theoryUrl));
+        } catch (err) {
+            setTheory('<p>Failed to load theory. Please refresh the page.</p>');
+            console.error('Theory fetch error:', err);
+        }
+    };
+
     if (loading) {
         return (
             <div className="topic-loading">
@@ -80,10 +92,14 @@ const Topic = () => {
                 {/* Theory Section */}
                 <div className="theory-section">
                     <h2>📚 Theory</h2>
-                    <div 
-                        className="theory-content"
-                        dangerouslySetInnerHTML={{ __html: topic.theory }}
-                    />
+                    {theory === null ? (
+                        <p>Loading theory...</p>
+                    ) : (
+                        <div 
+                            className="theory-content"
+                            dangerouslySetInnerHTML={{ __html: theory }}
+                        />
+                    )}
                 </div>
 
                 {/* Instructions */}
@@ -97,6 +97,13 @@ export const getTopic = async (topicId) => {
     return response.data;
 };
 
+// Theory links are signed and public, so they are fetched without the API token.
+// They are paths on the API's origin.
+export const getTheory = async (theoryUrl) => {
+    const response = await axios.get(new URL(theoryUrl, API_BASE_URL).href, { timeout: 30000 });
+    return response.data.theory;
+};
+
 export const getQuestion = async (questionId) => {
     const response = await API.get(`/questions/${questionId}/`);
     return response.data;
@@ -109,7 +116,38 @@ export const runCode = async (code) => {
 
 export const submitCode = async (questionId, code) => {
     const response = await API.post(`/submit/${questionId}/`, { code });
+    // Queue mode: the server returns a job to poll instead of the result
+    if (response.status === 202) {
+        return pollJob(response.data.job_id);
+    }
+    return response.data;
+};
+
+export const getJob = async (jobId) => {
+    const response = await API.get(`/jobs/${jobId}/`);
     return response.data;
 };
 
+// Polls with backoff and gives up after `timeout` ms, e.g. when no worker drains the queue
+const pollJob = async (jobId, { interval = 500, maxInterval = 4000, timeout = 60000 } = {}) => {
+    const deadline = Date.now() + timeout;
+    let delay = interval;
+    let job = null;
+    while (Date.now() < deadline) {
+        job = await getJob(jobId);
+        if (job.status === 'done' || job.status === 'failed') {
+            return job.result;
+        }
+        await new Promise((resolve) => setTimeout(resolve, delay));
+        delay = Math.min(delay * 2, maxInterval);
+    }
+    const error = new Error(
+        job && job.status === 'queued'
+            ? 'Your submission is still waiting to be graded. Please try again later.'
+            : 'Grading took too long. Please try again later.'
+    );
+    error.pollTimeout = true;
+    throw error;
+};
+
 export default API;
\ No newline at end of file